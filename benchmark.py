@@ -0,0 +1,365 @@
+"""
+Banc d'essai hors ligne des chemins critiques de la modération.
+
+Le bot est chargé tel quel (import discord.py) dans un dossier temporaire, sans connexion à
+Discord : des objets factices remplacent Message, Member, Guild et TextChannel, et des flux de
+messages synthétiques traversent les vrais gestionnaires (on_message, log_action, add_warn,
+build_transcript). Pour chaque scénario on mesure le débit (opérations/s), les latences p50/p99
+et la mémoire allouée (tracemalloc), puis on compare à bench_baseline.json.
+
+Les temps absolus varient d'une machine (et d'une minute) à l'autre : chaque scénario est encadré
+par une boucle d'étalonnage en pur Python, et son débit comme sa latence p99 sont comparés à la
+référence une fois rapportés à cet étalon. Même étalonnés, ces temps restent bruités sur une
+machine partagée : par défaut, seule la mémoire (indépendante de la machine) décide du code de
+sortie et les écarts de temps sont de simples avertissements ; --strict les rend bloquants.
+
+Utilisation :
+    python benchmark.py                     # exécute tout et compare à la référence
+    python benchmark.py --only on_message_clean log_action
+    python benchmark.py --strict            # les écarts de temps étalonnés font aussi échouer
+    python benchmark.py --update-baseline   # enregistre les résultats comme nouvelle référence
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.ext import commands
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BOT_FILE = os.path.join(ROOT, "import discord.py")
+BASELINE_FILE = os.path.join(ROOT, "bench_baseline.json")
+DEFAULT_TOLERANCE = 0.5 # Écart relatif toléré (après étalonnage) avant de signaler une régression
+MEMORY_TOLERANCE = 0.25 # Écart relatif toléré sur le pic mémoire, reproductible d'une machine à l'autre
+CALIBRATION_ROUNDS = 5 # Passages de la boucle d'étalonnage avant et après chaque scénario (médiane)
+
+# --- Objets Discord factices ---
+class FakePermissions:
+    def __init__(self, manage_messages=False, administrator=False):
+        self.manage_messages = manage_messages
+        self.administrator = administrator
+
+class FakeGuild:
+    def __init__(self, guild_id=1, name="Serveur de test", shard_id=0):
+        self.id = guild_id
+        self.name = name
+        self.shard_id = shard_id
+        self.members = []
+
+    async def ban(self, user, reason=None, **kwargs):
+        user.bans += 1
+
+class FakeMember:
+    def __init__(self, member_id, guild, name=None, bot=False, created_at=None, permissions=None):
+        self.id = member_id
+        self.guild = guild
+        self.name = name or f"membre{member_id}"
+        self.display_name = self.name
+        self.bot = bot
+        self.created_at = created_at or datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.guild_permissions = permissions or FakePermissions()
+        self.mention = f"<@{member_id}>"
+        self.roles = []
+        self.bans = 0
+
+    def __str__(self):
+        return self.name
+
+class FakeTextChannel:
+    def __init__(self, channel_id, guild, name="général", history=()):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self._history = list(history)
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+    async def history(self, limit=None, oldest_first=False):
+        messages = self._history if oldest_first else reversed(self._history)
+        for count, message in enumerate(messages):
+            if limit is not None and count >= limit:
+                return
+            yield message
+
+class FakeMessage:
+    def __init__(self, message_id, author, channel, content, created_at=None):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.deleted = False
+
+    async def delete(self, **kwargs):
+        self.deleted = True
+
+# --- Chargement du bot ---
+def load_bot(workdir):
+    """Importe le bot dans workdir sans le connecter (bot.run est neutralisé)."""
+    os.environ.pop("DISCORD_TOKEN", None)
+    commands.Bot.run = lambda self, *args, **kwargs: None
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location("didi_bot", BOT_FILE)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        spec.loader.exec_module(module)
+
+    async def process_commands(message):
+        return None # Les commandes elles-mêmes ne font pas partie du banc d'essai
+    module.bot.process_commands = process_commands
+    return module
+
+# --- Génération des données synthétiques ---
+CLEAN_WORDS = ["salut", "tout", "le", "monde", "ça", "va", "bien", "merci", "quelqu'un", "joue", "ce", "soir", "?", "gg", "😂"]
+
+def make_members(guild, count):
+    return [FakeMember(100000 + i, guild) for i in range(count)]
+
+def clean_content(rng):
+    return " ".join(rng.choice(CLEAN_WORDS) for _ in range(rng.randint(3, 25)))
+
+def make_message_stream(rng, guild, count, members, bad_ratio=0.0, invite_ratio=0.0, bad_word="exemple"):
+    channel = FakeTextChannel(500, guild)
+    stream = []
+    for i in range(count):
+        roll = rng.random()
+        content = clean_content(rng)
+        if roll < bad_ratio:
+            content += f" {bad_word}"
+        elif roll < bad_ratio + invite_ratio:
+            content += " discord.gg/abcdef"
+        stream.append(FakeMessage(900000 + i, rng.choice(members), channel, content))
+    return stream
+
+# --- Mesure ---
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def drain_all(bot_module):
+    """finish commun : sanctions automatiques en file, puis écritures du travailleur de persistance."""
+    async def finish():
+        await bot_module.moderation_queue.drain()
+        bot_module.persistence.drain()
+    return finish
+
+def calibrate():
+    """Durée médiane (µs) d'une charge fixe en pur Python (dictionnaires, chaînes, JSON) : l'étalon de vitesse."""
+    timings = []
+    for _ in range(CALIBRATION_ROUNDS):
+        started = time.perf_counter_ns()
+        counts = {}
+        for i in range(20000):
+            word = f"mot{i % 97}"
+            counts[word] = counts.get(word, 0) + len(word.lower())
+        json.loads(json.dumps(counts))
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return timings[len(timings) // 2] / 1000
+
+async def measure(name, operations, run_one, finish=None):
+    """
+    Exécute run_one(op) pour chaque opération : d'abord chronométré, puis sous tracemalloc.
+    finish (optionnel, coroutine) termine le travail différé (sanctions et écritures en file) et compte dans le débit,
+    mais pas dans les latences, qui restent celles vues par la boucle d'événements.
+    L'étalon est mesuré juste avant et juste après le passage chronométré, pour suivre la vitesse de la machine.
+    """
+    calibration = calibrate()
+    latencies = []
+    started = time.perf_counter()
+    for op in operations:
+        t0 = time.perf_counter_ns()
+        await run_one(op)
+        latencies.append(time.perf_counter_ns() - t0)
+    if finish is not None:
+        await finish()
+    elapsed = time.perf_counter() - started
+    calibration = (calibration + calibrate()) / 2
+
+    # Deuxième passage (plus lent, non chronométré) pour les allocations
+    sample = operations[:max(1, len(operations) // 10)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for op in sample:
+        await run_one(op)
+    if finish is not None:
+        await finish()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "ops": len(operations),
+        "ops_per_sec": round(len(operations) / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.50) / 1000, 2),
+        "p99_us": round(percentile(latencies, 0.99) / 1000, 2),
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_bytes_per_op": round((after - before) / len(sample), 1),
+        "calibration_us": round(calibration, 1),
+    }
+
+# --- Scénarios ---
+async def bench_on_message_clean(bot_module, rng, scale):
+    """Messages ordinaires, anti-raid désactivé : coût minimal du filtre par message."""
+    guild = FakeGuild()
+    members = make_members(guild, 500)
+    stream = make_message_stream(rng, guild, 20000 * scale, members)
+    bot_module.get_guild_state(guild).anti_raid = False
+    return await measure("on_message_clean", stream, bot_module.on_message, finish=drain_all(bot_module))
+
+async def bench_on_message_mixed(bot_module, rng, scale):
+    """Anti-raid activé, 2 % de mots interdits, 1 % d'invitations, quelques spammeurs bannis."""
+    guild = FakeGuild()
+    members = make_members(guild, 2000)
+    stream = make_message_stream(rng, guild, 20000 * scale, members, bad_ratio=0.02, invite_ratio=0.01, bad_word=bot_module.bad_words[-1])
+    bot_module.get_guild_state(guild).anti_raid = True
+    try:
+        return await measure("on_message_mixed", stream, bot_module.on_message, finish=drain_all(bot_module))
+    finally:
+        bot_module.get_guild_state(guild).anti_raid = False
+
+async def bench_log_action(bot_module, rng, scale):
+    """Écriture d'entrées dans le journal d'audit (backend configuré, JSONL par défaut), jusqu'au disque."""
+    guild = FakeGuild()
+    moderator = FakeMember(1, guild, name="modérateur")
+    targets = make_members(guild, 1000)
+    ops = [(rng.choice(["warn", "kick", "ban", "mute"]), rng.choice(targets)) for _ in range(20000 * scale)]
+
+    async def run_one(op):
+        bot_module.log_action(op[0], moderator, op[1], "Banc d'essai")
+    return await measure("log_action", ops, run_one, finish=drain_all(bot_module))
+
+async def bench_add_warn(bot_module, rng, scale):
+    """Ajout d'avertissements sur 10 serveurs (écriture différée : seul le coût en mémoire est sur le chemin critique)."""
+    ops = [(rng.randrange(10), rng.randrange(1000)) for _ in range(20000 * scale)]
+
+    async def run_one(op):
+        bot_module.add_warn(op[0], op[1], "Banc d'essai")
+    return await measure("add_warn", ops, run_one)
+
+async def bench_build_transcript(bot_module, rng, scale):
+    """Retranscription d'un ticket de 2000 messages."""
+    guild = FakeGuild()
+    members = make_members(guild, 5)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    placeholder = FakeTextChannel(600, guild)
+    history = [
+        FakeMessage(i, rng.choice(members), placeholder, clean_content(rng), created_at=start + timedelta(seconds=i))
+        for i in range(2000)
+    ]
+    channels = [FakeTextChannel(600 + i, guild, name=f"ticket-{i}", history=history) for i in range(20 * scale)]
+    closer = members[0]
+
+    async def run_one(channel):
+        await bot_module.build_transcript(channel, closer)
+    return await measure("build_transcript", channels, run_one)
+
+SCENARIOS = {
+    "on_message_clean": bench_on_message_clean,
+    "on_message_mixed": bench_on_message_mixed,
+    "log_action": bench_log_action,
+    "add_warn": bench_add_warn,
+    "build_transcript": bench_build_transcript,
+}
+
+# --- Comparaison avec la référence ---
+def relative_speed(result, reference):
+    """Vitesse de la machine pendant le scénario par rapport à la référence (> 1 : plus rapide)."""
+    if not reference.get("calibration_us"):
+        return 1.0 # Référence antérieure à l'étalonnage : temps comparés tels quels
+    return reference["calibration_us"] / result["calibration_us"]
+
+def compare(results, baseline, tolerance):
+    """
+    Retourne (écarts de mémoire, écarts de temps). Les temps de référence sont ajustés à la vitesse
+    mesurée par l'étalon avant de comparer le débit et la latence p99.
+    """
+    memory, timings = [], []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        speed = relative_speed(result, reference)
+        expected_ops = reference["ops_per_sec"] * speed
+        if result["ops_per_sec"] < expected_ops * (1 - tolerance):
+            timings.append(f"{name}: débit {result['ops_per_sec']}/s < {expected_ops:.0f}/s attendus (référence étalonnée)")
+        expected_p99 = reference["p99_us"] / speed
+        if result["p99_us"] > expected_p99 * (1 + tolerance):
+            timings.append(f"{name}: p99 {result['p99_us']}µs > {expected_p99:.1f}µs attendus (référence étalonnée)")
+        if result["peak_kib"] > max(reference["peak_kib"] * (1 + MEMORY_TOLERANCE), reference["peak_kib"] + 64):
+            memory.append(f"{name}: pic mémoire {result['peak_kib']} KiB > référence {reference['peak_kib']} KiB")
+    return memory, timings
+
+def print_table(results, baseline):
+    print(f"{'scénario':<20}{'ops/s':>12}{'p50 µs':>10}{'p99 µs':>10}{'pic KiB':>10}{'o/op':>8}{'étalon':>10}{'vs réf.':>10}")
+    for name, r in results.items():
+        reference = baseline.get(name)
+        delta = f"{(r['ops_per_sec'] / (reference['ops_per_sec'] * relative_speed(r, reference)) - 1) * 100:+.0f}%" if reference else "-"
+        print(f"{name:<20}{r['ops_per_sec']:>12}{r['p50_us']:>10}{r['p99_us']:>10}{r['peak_kib']:>10}{r['retained_bytes_per_op']:>8}{r['calibration_us']:>10}{delta:>10}")
+
+async def run_benchmarks(names, scale, seed):
+    workdir = tempfile.mkdtemp(prefix="didi-bench-")
+    bot_module = load_bot(workdir)
+    results = {}
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for name in names:
+            results[name] = await SCENARIOS[name](bot_module, random.Random(seed), scale)
+        bot_module.persistence.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne des chemins critiques du bot.")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), help="scénarios à exécuter (tous par défaut)")
+    parser.add_argument("--scale", type=int, default=1, help="multiplie le volume de chaque scénario")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="écart relatif toléré après étalonnage (0.5 = 50 %%)")
+    parser.add_argument("--strict", action="store_true", help="échoue aussi sur les écarts de temps (machine dédiée et stable)")
+    parser.add_argument("--update-baseline", action="store_true", help=f"enregistre les résultats dans {os.path.basename(BASELINE_FILE)}")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("scenarios", {})
+
+    names = args.only or list(SCENARIOS)
+    results = asyncio.run(run_benchmarks(names, args.scale, args.seed))
+    print_table(results, baseline)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "discord.py": discord.__version__,
+                "scale": args.scale,
+                "scenarios": baseline
+            }, f, indent=4, ensure_ascii=False)
+            f.write("\n")
+        print(f"Référence mise à jour : {BASELINE_FILE}")
+        return 0
+
+    memory, timings = compare(results, baseline, args.tolerance)
+    regressions = memory + timings if args.strict else memory
+    if not args.strict:
+        for timing in timings:
+            print(f"Avertissement : {timing}")
+    for regression in regressions:
+        print(f"RÉGRESSION : {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,71 +1,762 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import View, Button
+import gzip
+import html
+import io
 import json
 import os
+import queue
 import asyncio
+import bisect
+import concurrent.futures
+import heapq
 import re
 import random
-from datetime import datetime, timezone
+import time
+import sqlite3
+import threading
+import typing
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 # --- Configuration ---
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN")
-PREFIX = "!"
-LOGS_FILE = "logs.json"
+PREFIX = "!" # Préfixe par défaut si config.json n'en définit pas (clé "prefix", ex : "!,:" pour plusieurs)
+CONFIG_FILE = "config.json" # Réglages globaux et, dans la section "guilds", réglages propres à chaque serveur
+AUTO_SHARD = os.getenv("AUTO_SHARD", "0") == "1" # Utiliser AutoShardedBot (plusieurs connexions à la passerelle)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None # Avec AUTO_SHARD : None = nombre recommandé par Discord
+CACHE_POLICY = os.getenv("CACHE_POLICY", "full").lower() # "full" (tous les membres en cache) ou "lean" (cache réduit, membres chargés à la demande)
+LOGS_FILE = "logs.json" # Ancien format, migré une seule fois vers LOGS_DIR
+LOGS_DIR = "logs"
+LOG_SEGMENT_MAX_BYTES = 5 * 1024 * 1024 # Taille à partir de laquelle un nouveau segment est ouvert
+LOG_SEGMENT_MAX_AGE_SECONDS = 86400 # Âge à partir duquel un nouveau segment est ouvert
+LOG_RETENTION_DAYS = None # Au-delà, les archives sont compactées (ex : 365), None = tout garder
+LOG_COMPACTION_MODE = "summarize" # "summarize" (un résumé par segment) ou "drop" (suppression)
+MODLOGS_PAGE_SIZE = 10 # Nombre d'entrées par page de !modlogs
 WARNS_FILE = "warns.json"
+WARNS_FLUSH_INTERVAL = 5 # Secondes entre deux écritures groupées des avertissements
+WARN_EXPIRY_SECONDS = None # Durée de vie d'un avertissement (ex : 30 * 86400), None = permanent
+JOBS_FILE = "jobs.json" # Tâches planifiées (fin de tempmute, tirage de giveaway, expiration d'avertissement)
+JOB_MAX_ATTEMPTS = 5 # Une tâche planifiée qui échoue est retentée jusqu'à JOB_MAX_ATTEMPTS fois...
+JOB_RETRY_DELAY_SECONDS = 60 # ... après un délai qui double à chaque échec
+GIVEAWAYS_FILE = "giveaways.json" # Concours et leurs participants, suivis au fil des réactions
+GIVEAWAY_EMOJI = "🎉"
+GIVEAWAY_RETENTION_SECONDS = 7 * 86400 # Durée de conservation d'un concours terminé (pour !reroll)
+TICKETS_FILE = "tickets.json" # Registre des tickets ouverts (créateur, salon, date, état, responsable)
+SENDALL_STATE_FILE = "sendall_state.json" # Progression des envois en masse, pour reprendre après un redémarrage
+SENDALL_MAX_CONCURRENCY = 8 # Nombre maximal de DMs envoyés en parallèle par !sendall
+SENDALL_SLOW_SEND_SECONDS = 2.0 # Un envoi plus lent signale que Discord nous fait attendre (limite de débit)
+SENDALL_PROGRESS_INTERVAL = 10 # Secondes entre deux mises à jour du message de progression
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower() # "json" (fichiers plats) ou "sqlite"
+DB_FILE = os.getenv("DB_FILE", "didi.db")
 
 TICKET_CATEGORY_NAME = "Tickets support"
+TRANSCRIPT_FORMAT = "txt" # Format des retranscriptions de tickets : "txt" ou "html"
+TRANSCRIPT_GZIP = False # Compresser la pièce jointe de retranscription (.gz)
+NOTIFY_CONCURRENCY = 10 # Nombre maximal de DMs de notification envoyés en parallèle au staff
+NOTIFY_TIMEOUT = 15 # Secondes avant d'abandonner l'envoi d'une notification à un destinataire
 MAX_WARNS = 3
-
-
-bad_words = ["mot1", "mot2", "mot3", "exemple"]
-
-intents = discord.Intents.all()
+MUTE_MODE = "role" # "role" (rôle MUTED_ROLE_NAME géré par le bot) ou "timeout" (exclusion native Discord, 28 jours max)
+MUTED_ROLE_NAME = "Muted"
+RAID_MAX_MESSAGES = 2 # Anti-raid : bannir au bout de RAID_MAX_MESSAGES messages...
+RAID_WINDOW_SECONDS = 1.0 # ... envoyés en moins de RAID_WINDOW_SECONDS secondes
+RAID_TRACKER_MAX_USERS = 10000 # Nombre maximal d'utilisateurs suivis simultanément (mémoire bornée)
+RAID_MIN_ACCOUNT_AGE_SECONDS = 600 # Anti-raid : un compte plus récent (10 minutes) est banni à son premier message
+RAID_JOIN_MAX = 10 # Anti-raid : verrouillage au bout de RAID_JOIN_MAX arrivées...
+RAID_JOIN_MAX_NEW_ACCOUNTS = 4 # ... ou de RAID_JOIN_MAX_NEW_ACCOUNTS arrivées de comptes récents...
+RAID_JOIN_WINDOW_SECONDS = 10.0 # ... en moins de RAID_JOIN_WINDOW_SECONDS secondes
+RAID_JOIN_NEW_ACCOUNT_SECONDS = 7 * 86400 # Âge en dessous duquel un compte qui arrive est considéré comme récent
+RAID_LOCKDOWN_ACTION = "ban" # Sort des arrivants pendant un verrouillage : "ban" (par lots de 200) ou "kick"
+RAID_LOCKDOWN_BATCH_SECONDS = 2.0 # Intervalle entre deux traitements de la file des arrivants
+RAID_LOCKDOWN_SECONDS = 300 # Le verrouillage se lève après RAID_LOCKDOWN_SECONDS secondes sans nouvelle arrivée
+MODERATION_CONCURRENCY = 4 # Nombre maximal de sanctions automatiques (ban, kick) exécutées en parallèle
+MODERATION_DEDUP_SECONDS = 10.0 # Une même sanction (serveur, membre, action) redemandée dans ce délai n'est exécutée qu'une fois
+MODERATION_MAX_ATTEMPTS = 4 # Tentatives par sanction en cas de limite de débit (429) ou d'erreur serveur de Discord
+# Exemptions par filtre de messages : ID de rôles, ID de salons et permission qui dispensent du filtre
+FILTER_EXEMPTIONS = {
+    "anti_raid": {"roles": [], "channels": [], "permission": "manage_messages"},
+    "invites": {"roles": [], "channels": [], "permission": "manage_messages"},
+    "bad_words": {"roles": [], "channels": [], "permission": None},
+}
+BAD_WORDS_FILE = "bad_words.json" # Liste JSON optionnelle, rechargeable à chaud avec !reloadwords
+BAD_WORDS_MODE = "word" # "word" (mots entiers uniquement) ou "substring" (n'importe où dans le texte)
+METRICS_FILE = os.getenv("METRICS_FILE") # Fichier texte Prometheus réécrit périodiquement (optionnel)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None # Port local (127.0.0.1) exposant /metrics (optionnel)
+METRICS_EXPORT_INTERVAL = 15 # Secondes entre deux écritures de METRICS_FILE
+
+
+bad_words = ["mot1", "mot2", "mot3", "exemple"] # Liste par défaut si BAD_WORDS_FILE n'existe pas
+
+# Politique de cache : "full" reçoit tous les événements et garde tous les membres de tous les
+# serveurs en mémoire (découpage complet au démarrage). "lean" ne demande que les intents utilisés
+# (pas de présences, de saisie ni d'états vocaux), ne découpe pas les serveurs au démarrage et ne
+# garde en cache que les membres arrivés ou mis à jour (rôles, pseudo) depuis le démarrage. Les
+# auteurs des messages n'y entrent pas : les listes complètes sont chargées à la demande (voir
+# get_guild_members), un membre précis avec resolve_member.
+if CACHE_POLICY == "lean":
+    intents = discord.Intents.default()
+    intents.members = True # Arrivées, départs, rôles (index du staff) et découpage à la demande
+    intents.typing = False
+    intents.voice_states = False
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.joined = True
+else:
+    intents = discord.Intents.all()
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
 intents.message_content = True
 
-bot = commands.Bot(command_prefix=PREFIX, intents=intents, help_command=None)
+bot_options = {
+    "command_prefix": PREFIX,
+    "intents": intents,
+    "member_cache_flags": member_cache_flags,
+    "chunk_guilds_at_startup": CACHE_POLICY != "lean",
+    "help_command": None,
+}
+if AUTO_SHARD:
+    bot = commands.AutoShardedBot(shard_count=SHARD_COUNT, **bot_options)
+else:
+    bot = commands.Bot(**bot_options)
+
+# --- Métriques et Instrumentation ---
+# Histogrammes de latence à seaux fixes (mémoire constante, O(log n) par mesure) regroupés par
+# famille : "command" (par commande), "on_message" (par étape du filtre), "rest" (par route de
+# l'API Discord), "gateway" (requêtes à la passerelle, comme le découpage des membres) et
+# "storage" (écritures mesurées dans le travailleur de persistance). Les compteurs sont de simples
+# entiers nommés, les jauges des fonctions évaluées à la lecture. Le tout est consultable avec
+# !stats et exportable au format texte Prometheus (METRICS_FILE et/ou METRICS_PORT).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Secondes
+METRIC_LABELS = {"command": "command", "on_message": "stage", "rest": "route", "gateway": "operation", "storage": "operation"}
+metrics_started_at = time.time()
+latency_histograms = {} # {(famille, libellé): LatencyHistogram}
+metric_counters = Counter() # {nom: valeur}
+metric_gauges = {} # {nom: fonction sans argument retournant la valeur courante}
+startup_seconds = None # Durée entre le lancement et le premier on_ready (découpage des serveurs compris)
+
+def process_rss_bytes():
+    """Mémoire résidente actuelle du processus (à défaut de /proc, son pic), 0 si inconnue."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource # Absent sous Windows
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
+metric_gauges["process_rss_bytes"] = process_rss_bytes
+metric_gauges["startup_seconds"] = lambda: startup_seconds or 0
+metric_gauges["cached_members"] = lambda: sum(len(guild.members) for guild in bot.guilds)
 
-anti_raid_enabled = False
-user_last_message_times = {}
+class LatencyHistogram:
+    __slots__ = ("buckets", "count", "total", "max")
 
-# --- Gestionnaires de Fichiers JSON ---
-def init_logs():
-    """Initialise le fichier JSON des logs s'il n'existe pas ou s'il est vide/corrompu."""
-    if not os.path.exists(LOGS_FILE) or os.path.getsize(LOGS_FILE) == 0:
-        with open(LOGS_FILE, "w", encoding="utf-8") as f:
-            json.dump({"actions": []}, f, indent=4)
-    else:
-        try:
-            with open(LOGS_FILE, "r", encoding="utf-8") as f:
-                json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: {LOGS_FILE} is corrupted. Reinitializing it.")
-            with open(LOGS_FILE, "w", encoding="utf-8") as f:
-                json.dump({"actions": []}, f, indent=4)
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1) # Le dernier seau compte les valeurs au-delà
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimation par excès : borne supérieure du seau contenant le q-ième quantile."""
+        if not self.count:
+            return 0.0
+        rank, cumulative = q * self.count, 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += n
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+def observe_latency(family, label, seconds):
+    histogram = latency_histograms.get((family, label))
+    if histogram is None:
+        histogram = latency_histograms[(family, label)] = LatencyHistogram()
+    histogram.observe(seconds)
+
+def increment(name, value=1):
+    metric_counters[name] += value
+
+class timed:
+    """Mesure la durée d'un bloc : with timed("on_message", "bad_words"): ..."""
+    __slots__ = ("family", "label", "start")
+
+    def __init__(self, family, label):
+        self.family = family
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        observe_latency(self.family, self.label, time.perf_counter() - self.start)
+
+# Chaque appel REST passe par HTTPClient.request : on l'enveloppe une fois pour mesurer toutes les routes
+_original_http_request = bot.http.request
+
+async def _timed_http_request(route, **kwargs):
+    start = time.perf_counter()
+    try:
+        return await _original_http_request(route, **kwargs)
+    except discord.HTTPException as e:
+        increment(f"rest_errors_{e.status}")
+        raise
+    finally:
+        # route.path est le gabarit ("/channels/{channel_id}/messages"), pas l'URL : peu de libellés distincts
+        observe_latency("rest", f"{route.method} {route.path}", time.perf_counter() - start)
+
+bot.http.request = _timed_http_request
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus():
+    """Instantané des métriques au format d'exposition texte de Prometheus."""
+    lines = [f"didi_uptime_seconds {time.time() - metrics_started_at:.0f}"]
+    lines.append("# TYPE didi_events_total counter")
+    for name, value in sorted(metric_counters.items()):
+        lines.append(f'didi_events_total{{event="{_escape_label(name)}"}} {value}')
+    lines.append("# TYPE didi_gauge gauge")
+    for name, func in sorted(metric_gauges.items()):
+        lines.append(f'didi_gauge{{name="{_escape_label(name)}"}} {func()}')
+    for family, label_name in METRIC_LABELS.items():
+        metric = f"didi_{family}_latency_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for (hist_family, label), histogram in sorted(latency_histograms.items()):
+            if hist_family != family:
+                continue
+            label = f'{label_name}="{_escape_label(label)}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, histogram.buckets):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum{{{label}}} {histogram.total:.6f}")
+            lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+@tasks.loop(seconds=METRICS_EXPORT_INTERVAL)
+async def metrics_export_loop():
+    persistence.submit(_atomic_write_text, METRICS_FILE, render_prometheus()) # Instantané pris sur la boucle
+
+async def _serve_metrics(reader, writer):
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        body = render_prometheus().encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+_metrics_server = None
+
+async def start_metrics_exporters():
+    """Démarre l'export optionnel des métriques (fichier et/ou point d'accès HTTP local)."""
+    global _metrics_server
+    if METRICS_FILE and not metrics_export_loop.is_running():
+        metrics_export_loop.start()
+    if METRICS_PORT and _metrics_server is None:
+        _metrics_server = await asyncio.start_server(_serve_metrics, "127.0.0.1", METRICS_PORT)
+        print(f"DEBUG: Métriques exposées sur http://127.0.0.1:{METRICS_PORT}/metrics")
+
+# --- Travailleur de Persistance ---
+# Toutes les E/S disque (fichiers JSON, journal d'audit, SQLite) passent par un unique thread
+# alimenté par une file : la boucle d'événements n'attend jamais le disque. Les tâches sont
+# exécutées dans leur ordre de soumission, donc une lecture voit toujours les écritures soumises
+# avant elle, et deux écritures d'un même fichier ne peuvent pas s'inverser.
+#   persistence.submit(func, *args)      -> écriture sans attente (les erreurs sont journalisées)
+#   await persistence.call(func, *args)  -> lecture (ou écriture) dont on attend le résultat
+#   persistence.stop()                   -> vide la file puis arrête le thread (arrêt du bot)
+class PersistenceWorker:
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            func, args, future = item
+            if future is not None and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args) if func is not None else None
+            except Exception as e:
+                if future is not None:
+                    future.set_exception(e)
+                else:
+                    print(f"Erreur dans le travailleur de persistance ({func.__name__}) : {e}")
+                continue
+            if future is not None:
+                future.set_result(result)
+
+    def submit(self, func, *args):
+        """Met une écriture en file, sans attendre son exécution."""
+        self._ensure_started()
+        self._queue.put((func, args, None))
+
+    def call(self, func, *args):
+        """Met une tâche en file et retourne un awaitable de son résultat."""
+        self._ensure_started()
+        future = concurrent.futures.Future()
+        self._queue.put((func, args, future))
+        return asyncio.wrap_future(future)
+
+    def call_blocking(self, func, *args):
+        """
+        Exécute func dans le travailleur et attend son résultat en bloquant l'appelant (chargements
+        paresseux qui ne doivent jamais tourner ailleurs) ; depuis le travailleur, l'appel est direct.
+        """
+        if threading.current_thread() is self._thread:
+            return func(*args)
+        self._ensure_started()
+        future = concurrent.futures.Future()
+        self._queue.put((func, args, future))
+        return future.result()
+
+    def drain(self, timeout=None):
+        """Bloque jusqu'à ce que toutes les tâches déjà soumises soient exécutées."""
+        if self._thread is None or threading.current_thread() is self._thread:
+            return
+        marker = concurrent.futures.Future()
+        self._queue.put((None, (), marker))
+        marker.result(timeout)
 
-def init_warns():
-    """Initialise le fichier JSON des avertissements s'il n'existe pas ou s'il est vide/corrompu."""
-    if not os.path.exists(WARNS_FILE) or os.path.getsize(WARNS_FILE) == 0:
-        with open(WARNS_FILE, "w", encoding="utf-8") as f:
-            json.dump({}, f, indent=4)
-    else:
+    def stop(self, timeout=30):
+        """Vide la file puis arrête le thread ; les soumissions suivantes le redémarrent."""
+        if self._thread is None:
+            return
+        self.drain(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+persistence = PersistenceWorker()
+metric_gauges["persistence_queue"] = persistence.qsize
+
+# --- Stockage SQLite (optionnel, STORAGE_BACKEND=sqlite) ---
+# Les mêmes fonctions (log_action, add_warn, load_warns, ...) écrivent alors dans une base SQLite
+# en mode WAL, indexée sur cible/modérateur/action/date. Les requêtes sont paramétrées et
+# gardées dans le cache d'instructions préparées de sqlite3. Les données JSON existantes sont
+# importées une seule fois à la création de la base.
+DB_SCHEMA_VERSION = 3
+db = None
+db_lock = threading.Lock() # La connexion est partagée avec les threads d'écriture
+
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    action TEXT NOT NULL,
+    moderator TEXT,
+    target TEXT,
+    reason TEXT,
+    duration TEXT,
+    details TEXT,
+    timestamp TEXT NOT NULL,
+    guild_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_actions_target ON actions(target, timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_moderator ON actions(moderator, timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_action ON actions(action, timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_timestamp ON actions(timestamp);
+
+CREATE TABLE IF NOT EXISTS warns (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    reason TEXT,
+    timestamp TEXT NOT NULL,
+    guild_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_warns_user ON warns(user_id);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    creator_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    opened_at TEXT NOT NULL,
+    closed_at TEXT,
+    closed_by TEXT,
+    claimed_by INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_creator ON tickets(creator_id, state);
+"""
+
+SQL_INSERT_ACTION = "INSERT INTO actions (action, moderator, target, reason, duration, details, timestamp, guild_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_INSERT_WARN = "INSERT INTO warns (guild_id, user_id, reason, timestamp) VALUES (?, ?, ?, ?)"
+SQL_DELETE_WARNS = "DELETE FROM warns WHERE guild_id IS ? AND user_id = ?"
+
+def init_db():
+    """Ouvre la base SQLite, crée le schéma et importe les données JSON au premier lancement."""
+    global db
+    if db is not None:
+        return db
+    if threading.current_thread() is not persistence._thread:
+        return persistence.call_blocking(init_db) # Ouverture et migration uniquement dans le travailleur
+    db = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=256)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    with db_lock, db:
+        db.executescript(DB_SCHEMA)
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            _import_json_into_db()
+        if version < 2:
+            _add_column_if_missing("tickets", "claimed_by", "INTEGER")
+        if version < 3:
+            # Avertissements et actions par serveur ; NULL = donnée antérieure, sans serveur connu
+            _add_column_if_missing("warns", "guild_id", "TEXT")
+            _add_column_if_missing("actions", "guild_id", "INTEGER")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_warns_guild_user ON warns(guild_id, user_id)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_actions_guild ON actions(guild_id, timestamp)")
+        db.execute(f"PRAGMA user_version = {DB_SCHEMA_VERSION}")
+    return db
+
+def _add_column_if_missing(table, column, column_type):
+    columns = {row["name"] for row in db.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+def _import_json_into_db():
+    """Import unique du journal JSONL et de warns.json dans une base neuve."""
+    imported = 0
+    for entry in _iter_json_logs():
+        db.execute(SQL_INSERT_ACTION, (
+            entry.get("action"), entry.get("moderator", entry.get("user")), entry.get("target"),
+            entry.get("reason"), entry.get("duration"), entry.get("details"), entry.get("timestamp", ""), entry.get("guild_id")
+        ))
+        imported += 1
+    if os.path.exists(WARNS_FILE) and os.path.getsize(WARNS_FILE) > 0:
         try:
             with open(WARNS_FILE, "r", encoding="utf-8") as f:
-                json.load(f)
+                legacy_warns = json.load(f)
         except json.JSONDecodeError:
-            print(f"Warning: {WARNS_FILE} is corrupted. Reinitializing it.")
-            with open(WARNS_FILE, "w", encoding="utf-8") as f:
-                json.dump({}, f, indent=4)
+            print(f"Warning: {WARNS_FILE} is corrupted. Les avertissements ne sont pas importés.")
+            legacy_warns = {}
+        for guild_key, guild_warns in _nest_legacy_warns(legacy_warns).items():
+            guild_id = None if guild_key == UNSCOPED_WARNS else guild_key
+            for user_id, user_warns in guild_warns.items():
+                db.executemany(SQL_INSERT_WARN, [(guild_id, user_id, w.get("reason"), w.get("timestamp", "")) for w in user_warns])
+    print(f"DEBUG: Base {DB_FILE} initialisée ({imported} actions importées).")
+
+def db_insert_action(entry):
+    with db_lock, db:
+        db.execute(SQL_INSERT_ACTION, (
+            entry["action"], entry["moderator"], entry["target"], entry["reason"],
+            entry["duration"], entry["details"], entry["timestamp"], entry["guild_id"]
+        ))
+
+def db_query_actions(targets=None, moderators=None, action=None, since=None, until=None, limit=50, before=None, guild_id=None):
+    """
+    Recherche les actions les plus récentes correspondant aux filtres (tous optionnels), via les index.
+    before est le curseur (timestamp, id) de la dernière ligne de la page précédente : chaque page
+    repart de l'index au lieu de relire et trier toutes les lignes qui la précèdent (OFFSET).
+    """
+    clauses, params = [], []
+    for column, values in (("target", targets), ("moderator", moderators), ("action", [action] if action else None)):
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since.isoformat())
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until.isoformat())
+    if before is not None:
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend(before)
+    columns = "id, action, moderator, target, reason, duration, details, timestamp, guild_id"
+    order = "ORDER BY timestamp DESC, id DESC LIMIT ?"
+    if guild_id is None:
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql, args = f"SELECT {columns} FROM actions {where} {order}", (*params, limit)
+    else:
+        # Uniquement les actions du serveur : les entrées sans serveur (anciennes, messages privés)
+        # appartiennent à tous et ne doivent apparaître dans aucun journal de serveur.
+        where = " ".join(f"AND {clause}" for clause in clauses)
+        sql, args = f"SELECT {columns} FROM actions WHERE guild_id = ? {where} {order}", (guild_id, *params, limit)
+    with db_lock:
+        rows = db.execute(sql, args).fetchall()
+    return [dict(row) for row in rows]
+
+def db_compact_actions(cutoff, mode):
+    """Rétention SQLite : résume (une ligne par type d'action) ou supprime les actions antérieures à cutoff."""
+    with db_lock, db:
+        if mode == "summarize":
+            groups = db.execute(
+                "SELECT guild_id, action, COUNT(*) AS n, MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts FROM actions "
+                "WHERE timestamp < ? AND action != 'summary' GROUP BY guild_id, action", (cutoff,)
+            ).fetchall()
+            for group in groups:
+                db.execute(SQL_INSERT_ACTION, (
+                    "summary", None, group["action"], f"Rétention de {LOG_RETENTION_DAYS} jours", None,
+                    f"{group['n']} actions '{group['action']}' compactées entre {group['first_ts']} et {group['last_ts']}",
+                    group["last_ts"], group["guild_id"]
+                ))
+        return db.execute("DELETE FROM actions WHERE timestamp < ? AND action != 'summary'", (cutoff,)).rowcount
+
+def db_load_warns():
+    """Reconstruit le dictionnaire {guild_id: {user_id: [avertissements]}} depuis la table des avertissements."""
+    warns = {}
+    with db_lock:
+        for row in db.execute("SELECT guild_id, user_id, reason, timestamp FROM warns ORDER BY id"):
+            guild_warns = warns.setdefault(row["guild_id"] or UNSCOPED_WARNS, {})
+            guild_warns.setdefault(row["user_id"], []).append({"reason": row["reason"], "timestamp": row["timestamp"]})
+    return warns
+
+def db_apply_warn_ops(ops):
+    """Applique en une transaction les opérations d'avertissement accumulées depuis la dernière écriture."""
+    with db_lock, db:
+        for op in ops:
+            if op[0] == "add":
+                db.execute(SQL_INSERT_WARN, op[1:])
+            elif op[0] == "remove":
+                db.execute("DELETE FROM warns WHERE guild_id = ? AND user_id = ? AND timestamp = ?", op[1:])
+            elif op[0] == "reset":
+                db.execute(SQL_DELETE_WARNS, op[1:])
+            elif op[0] == "claim":
+                db.execute("UPDATE warns SET guild_id = ? WHERE guild_id IS NULL AND user_id = ?", op[1:])
+
+def db_record_ticket_open(ticket):
+    with db_lock, db:
+        db.execute(
+            "INSERT OR REPLACE INTO tickets (channel_id, guild_id, creator_id, state, opened_at, claimed_by) VALUES (?, ?, ?, ?, ?, ?)",
+            (ticket["channel_id"], ticket["guild_id"], ticket["creator_id"], ticket["state"], ticket["opened_at"], ticket["claimed_by"])
+        )
+
+def db_record_ticket_claim(ticket):
+    with db_lock, db:
+        db.execute("UPDATE tickets SET claimed_by = ? WHERE channel_id = ?", (ticket["claimed_by"], ticket["channel_id"]))
+
+def db_record_ticket_close(channel_id, closed_by):
+    with db_lock, db:
+        db.execute(
+            "UPDATE tickets SET state = 'closed', closed_at = ?, closed_by = ? WHERE channel_id = ?",
+            (datetime.now(timezone.utc).isoformat(), str(closed_by), channel_id)
+        )
+
+def db_load_open_tickets():
+    with db_lock:
+        rows = db.execute(
+            "SELECT channel_id, guild_id, creator_id, state, opened_at, claimed_by FROM tickets WHERE state = 'open'"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+# --- Journal d'Audit (JSONL en ajout seul) ---
+# Chaque action est une ligne JSON ajoutée à la fin du segment actif : l'écriture coûte O(1)
+# quelle que soit la taille de l'historique. Quand un segment dépasse LOG_SEGMENT_MAX_BYTES ou
+# LOG_SEGMENT_MAX_AGE_SECONDS, on passe au suivant (logs/actions-000000.jsonl, ...) et l'ancien
+# est compressé en archive .jsonl.gz. logs/manifest.json résume chaque segment
+# fermé (nombre d'entrées, première et dernière date) sans avoir à le relire, ainsi que les
+# ensembles de cibles, modérateurs et types d'action qu'il contient : !modlogs n'ouvre que les
+# segments susceptibles de correspondre à sa recherche.
+LOG_MANIFEST_FILE = os.path.join(LOGS_DIR, "manifest.json")
+_log_segment = None # Fichier du segment actif, ouvert en ajout
+_log_segment_index = 0
+_log_segment_stats = None # Statistiques et index du segment actif
+_log_segment_started = None # Horodatage (epoch) de la première entrée du segment actif
+log_manifest = {} # {index: {"count", "first_ts", "last_ts", "targets", "moderators", "actions", "guilds", "compressed", "summarized"}}
+LOG_INDEXED_FIELDS = {"targets": "target", "moderators": "moderator", "actions": "action", "guilds": "guild_id"}
+# Toutes les fonctions de cette section s'exécutent dans le travailleur de persistance
+
+def _log_segment_path(index, compressed=False):
+    return os.path.join(LOGS_DIR, f"actions-{index:06d}.jsonl" + (".gz" if compressed else ""))
+
+def _list_log_segments():
+    """Retourne les index des segments existants (actifs ou archivés), triés dans l'ordre chronologique."""
+    if not os.path.isdir(LOGS_DIR):
+        return []
+    indexes = set()
+    for name in os.listdir(LOGS_DIR):
+        match = re.fullmatch(r"actions-(\d+)\.jsonl(\.gz)?", name)
+        if match:
+            indexes.add(int(match.group(1)))
+    return sorted(indexes)
+
+def _open_segment_for_reading(index):
+    # Une archive n'apparaît qu'une fois complète (renommage atomique) : elle est prioritaire
+    compressed = _log_segment_path(index, compressed=True)
+    if os.path.exists(compressed):
+        return gzip.open(compressed, "rt", encoding="utf-8")
+    try:
+        return open(_log_segment_path(index), "r", encoding="utf-8")
+    except FileNotFoundError: # Archivé entre-temps par le thread de compression
+        return gzip.open(compressed, "rt", encoding="utf-8")
+
+def _read_log_segment(index):
+    with _open_segment_for_reading(index) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Ligne tronquée (arrêt brutal pendant une écriture) : on l'ignore
+                print(f"DEBUG: Ligne corrompue ignorée dans le segment {index} du journal.")
+
+def _new_segment_stats():
+    return {"count": 0, "first_ts": None, "last_ts": None, "targets": set(), "moderators": set(), "actions": set(), "guilds": set()}
+
+def _entry_moderator(entry):
+    return entry.get("moderator", entry.get("user")) # Les anciennes entrées utilisaient "user"
+
+def _index_log_entry(stats, entry):
+    stats["count"] += 1
+    stats["first_ts"] = stats["first_ts"] or entry.get("timestamp")
+    stats["last_ts"] = entry.get("timestamp") or stats["last_ts"]
+    if entry.get("target"):
+        stats["targets"].add(entry["target"])
+    if _entry_moderator(entry):
+        stats["moderators"].add(_entry_moderator(entry))
+    stats["actions"].add(entry.get("action"))
+    stats["guilds"].add(entry.get("guild_id")) # None : entrée sans serveur, exclue des recherches par serveur
+
+def _segment_stats(index):
+    stats = _new_segment_stats()
+    for entry in _read_log_segment(index):
+        _index_log_entry(stats, entry)
+    return stats
+
+def _load_log_manifest():
+    if not os.path.exists(LOG_MANIFEST_FILE):
+        return
+    try:
+        with open(LOG_MANIFEST_FILE, "r", encoding="utf-8") as f:
+            for index, info in json.load(f).items():
+                for field in LOG_INDEXED_FIELDS:
+                    if field in info:
+                        info[field] = set(info[field])
+                log_manifest[int(index)] = info
+    except json.JSONDecodeError:
+        print(f"Warning: {LOG_MANIFEST_FILE} is corrupted. Il sera reconstruit depuis les segments.")
+
+def _save_log_manifest():
+    manifest = {
+        str(index): {key: sorted(value, key=str) if isinstance(value, set) else value for key, value in info.items()}
+        for index, info in sorted(log_manifest.items())
+    }
+    _atomic_write_text(LOG_MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False, indent=4))
+
+def _archive_log_segment(index):
+    """Compresse un segment fermé en .jsonl.gz puis supprime l'original."""
+    source, target = _log_segment_path(index), _log_segment_path(index, compressed=True)
+    if os.path.exists(source):
+        with open(source, "rb") as f_in, gzip.open(target + ".tmp", "wb") as f_out:
+            while chunk := f_in.read(1024 * 1024):
+                f_out.write(chunk)
+        os.replace(target + ".tmp", target)
+        os.remove(source)
+    log_manifest.setdefault(index, {}).update(compressed=True)
+    _save_log_manifest()
+
+def _archive_in_background(index):
+    # Passé en fin de file : les écritures déjà en attente ne patientent pas derrière la compression
+    persistence.submit(_archive_log_segment, index)
+
+def _open_log_segment(index):
+    """Ferme le segment actif et ouvre (ou crée) le segment demandé en ajout."""
+    global _log_segment, _log_segment_index, _log_segment_stats, _log_segment_started
+    if _log_segment is not None:
+        _log_segment.close()
+    _log_segment = open(_log_segment_path(index), "ab")
+    _log_segment_index = index
+    _log_segment_stats = _segment_stats(index) if _log_segment.tell() > 0 else _new_segment_stats()
+    first_ts = _log_segment_stats["first_ts"]
+    _log_segment_started = datetime.fromisoformat(first_ts).timestamp() if first_ts else None
+
+def _rotate_log_segment():
+    """Ferme le segment actif, l'inscrit au manifeste et lance sa compression."""
+    closed_index = _log_segment_index
+    log_manifest[closed_index] = {**_log_segment_stats, "compressed": False, "summarized": False}
+    _open_log_segment(closed_index + 1)
+    _save_log_manifest()
+    _archive_in_background(closed_index)
+
+def _migrate_legacy_logs():
+    """Migration unique de l'ancien logs.json ({"actions": [...]}) vers le premier segment JSONL."""
+    if not os.path.exists(LOGS_FILE):
+        return
+    if _list_log_segments():
+        # Déjà migré (arrêt entre la copie et le renommage) : on range simplement l'ancien fichier
+        os.replace(LOGS_FILE, LOGS_FILE + ".migrated")
+        return
+    try:
+        with open(LOGS_FILE, "r", encoding="utf-8") as f:
+            actions = json.load(f).get("actions", []) if os.path.getsize(LOGS_FILE) > 0 else []
+    except json.JSONDecodeError:
+        # On ne détruit plus l'historique : le fichier est mis de côté pour inspection
+        print(f"Warning: {LOGS_FILE} is corrupted. Il est conservé sous {LOGS_FILE}.corrupt.")
+        os.replace(LOGS_FILE, LOGS_FILE + ".corrupt")
+        return
+    tmp_path = _log_segment_path(0) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in actions:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, _log_segment_path(0))
+    os.replace(LOGS_FILE, LOGS_FILE + ".migrated")
+    print(f"DEBUG: {len(actions)} actions migrées de {LOGS_FILE} vers {LOGS_DIR}/.")
 
-def log_action(action_type, user, target=None, reason=None, duration=None, details=None):
-    """Enregistre les actions de modération dans un fichier JSON."""
-    init_logs()
-    with open(LOGS_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def init_logs():
+    """Prépare le journal d'audit : migration de l'ancien format, manifeste, puis ouverture du dernier segment."""
+    if _log_segment is not None:
+        return
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    _migrate_legacy_logs()
+    _load_log_manifest()
+    segments = _list_log_segments()
+    if segments and not os.path.exists(_log_segment_path(segments[-1], compressed=True)):
+        active_index = segments.pop() # Le dernier segment non archivé reste le segment actif
+    else:
+        active_index = segments[-1] + 1 if segments else 0
+    # Segments fermés sans entrée au manifeste ou pas encore compressés (journal antérieur, arrêt brutal)
+    for index in segments:
+        if not all(field in log_manifest.get(index, {}) for field in LOG_INDEXED_FIELDS):
+            log_manifest[index] = {"compressed": False, "summarized": False, **log_manifest.get(index, {}), **_segment_stats(index)}
+        if not os.path.exists(_log_segment_path(index, compressed=True)):
+            _archive_in_background(index)
+    _save_log_manifest()
+    _open_log_segment(active_index)
+
+def log_action(action_type, user, target=None, reason=None, duration=None, details=None, guild_id=None):
+    """
+    Ajoute une action de modération à la fin du journal d'audit (une ligne JSON).
+    Le serveur est déduit de la cible ou de l'auteur (membre, salon) si guild_id n'est pas fourni.
+    """
+    if guild_id is None:
+        guild = getattr(target, "guild", None) or getattr(user, "guild", None)
+        guild_id = guild.id if guild is not None else None
     entry = {
         "action": action_type,
         "moderator": str(user),
@@ -73,42 +764,929 @@ def log_action(action_type, user, target=None, reason=None, duration=None, detai
         "reason": reason,
         "duration": duration,
         "details": details,
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "guild_id": guild_id
     }
-    data["actions"].append(entry)
-    with open(LOGS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+    increment(f"action_{action_type}")
+    persistence.submit(_write_log_entry, entry)
+
+def _write_log_entry(entry):
+    # Chronométré dans le travailleur : mesure l'écriture elle-même, pas la mise en file
+    with timed("storage", "log_action"):
+        _store_log_entry(entry)
+
+def _store_log_entry(entry):
+    if STORAGE_BACKEND == "sqlite":
+        init_db()
+        db_insert_action(entry)
+        return
+    if _log_segment is None:
+        init_logs()
+    if _log_segment_started is not None and time.time() - _log_segment_started >= LOG_SEGMENT_MAX_AGE_SECONDS:
+        _rotate_log_segment()
+    _append_log_entry(entry)
+    if _log_segment.tell() >= LOG_SEGMENT_MAX_BYTES:
+        _rotate_log_segment()
+
+def _append_log_entry(entry):
+    global _log_segment_started
+    _log_segment.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+    _log_segment.flush()
+    if _log_segment_stats["first_ts"] is None:
+        _log_segment_started = time.time()
+    _index_log_entry(_log_segment_stats, entry)
+
+def _iter_json_logs():
+    """Vue unifiée : archives compressées puis segment actif."""
+    init_logs()
+    for index in _list_log_segments():
+        yield from _read_log_segment(index)
+
+def _entry_matches(entry, guild_id, targets, moderators, action, since, until):
+    timestamp = entry.get("timestamp") or ""
+    return (
+        (guild_id is None or entry.get("guild_id") == guild_id)
+        and (not targets or entry.get("target") in targets)
+        and (not moderators or _entry_moderator(entry) in moderators)
+        and (not action or entry.get("action") == action)
+        and (not since or timestamp >= since)
+        and (not until or timestamp < until)
+    )
+
+def _segment_may_match(info, guild_id, targets, moderators, action, since, until):
+    """Consulte l'index d'un segment : False si aucune de ses entrées ne peut correspondre."""
+    if guild_id is not None and guild_id not in info["guilds"]:
+        return False
+    if since and info["last_ts"] and info["last_ts"] < since:
+        return False
+    if until and info["first_ts"] and info["first_ts"] >= until:
+        return False
+    if targets and info["targets"].isdisjoint(targets):
+        return False
+    if moderators and info["moderators"].isdisjoint(moderators):
+        return False
+    return not action or action in info["actions"]
+
+def _scan_log_segments(indexes, guild_id, targets, moderators, action, since, until):
+    for index in indexes:
+        try:
+            matches = [entry for entry in _read_log_segment(index) if _entry_matches(entry, guild_id, targets, moderators, action, since, until)]
+        except FileNotFoundError: # Segment supprimé par la rétention pendant la recherche
+            print(f"DEBUG: Segment {index} du journal introuvable, ignoré.")
+            continue
+        yield from reversed(matches)
+
+def _query_db_actions(guild_id, targets, moderators, action, since, until, batch_size=100):
+    before = None
+    while True:
+        rows = db_query_actions(targets, moderators, action, since, until, limit=batch_size, before=before, guild_id=guild_id)
+        if rows:
+            before = (rows[-1]["timestamp"], rows[-1]["id"])
+        for row in rows:
+            del row["id"]
+            yield row
+        if len(rows) < batch_size:
+            return
+
+def query_logs(guild_id=None, targets=None, moderators=None, action=None, since=None, until=None):
+    """
+    Générateur des actions correspondant aux filtres, de la plus récente à la plus ancienne.
+    guild_id limite la recherche à un serveur (les entrées sans serveur sont alors exclues) ; targets et moderators sont des ensembles de valeurs acceptées (nom et ID d'un même utilisateur),
+    since et until des datetime. Les segments à lire sont choisis d'après les index en mémoire.
+    Le générateur doit être avancé dans le travailleur de persistance (persistence.call).
+    """
+    if STORAGE_BACKEND == "sqlite":
+        init_db()
+        yield from _query_db_actions(guild_id, targets, moderators, action, since, until)
+        return
+    init_logs()
+    since = since.isoformat() if since else None
+    until = until.isoformat() if until else None
+    segments = [(_log_segment_index, _log_segment_stats)] + sorted(log_manifest.items(), reverse=True)
+    indexes = [index for index, info in segments if _segment_may_match(info, guild_id, targets, moderators, action, since, until)]
+    yield from _scan_log_segments(indexes, guild_id, targets, moderators, action, since, until)
+
+# --- Rétention du Journal d'Audit ---
+def _summary_entry(guild_id, counts, first_ts, last_ts):
+    total = sum(counts.values())
+    return {
+        "action": "summary",
+        "moderator": None,
+        "target": None,
+        "reason": f"Rétention de {LOG_RETENTION_DAYS} jours",
+        "duration": None,
+        "details": f"{total} actions compactées entre {first_ts} et {last_ts} : " + ", ".join(f"{action} ×{n}" for action, n in counts.most_common()),
+        "timestamp": last_ts,
+        "guild_id": guild_id,
+        "counts": dict(counts)
+    }
+
+def compact_logs():
+    """
+    Applique la rétention LOG_RETENTION_DAYS aux archives : chaque segment entièrement plus ancien
+    est remplacé par une seule entrée de résumé (ou supprimé, selon LOG_COMPACTION_MODE).
+    Retourne le nombre de segments (ou de lignes SQLite) compactés.
+    """
+    if not LOG_RETENTION_DAYS:
+        return 0
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=LOG_RETENTION_DAYS)).isoformat()
+    if STORAGE_BACKEND == "sqlite":
+        init_db()
+        return db_compact_actions(cutoff, LOG_COMPACTION_MODE)
+    init_logs()
+    candidates = [
+        index for index, info in log_manifest.items()
+        if info.get("compressed") and not info.get("summarized") and info.get("last_ts") and info["last_ts"] < cutoff
+    ]
+    for index in candidates:
+        archive = _log_segment_path(index, compressed=True)
+        if LOG_COMPACTION_MODE == "drop":
+            os.remove(archive)
+            del log_manifest[index]
+            continue
+        counts_by_guild = {} # Un résumé par serveur, pour que chacun ne voie que le sien
+        for entry in _read_log_segment(index):
+            counts_by_guild.setdefault(entry.get("guild_id"), Counter())[entry.get("action")] += 1
+        info = log_manifest[index]
+        with gzip.open(archive + ".tmp", "wt", encoding="utf-8") as f:
+            for guild_id, counts in counts_by_guild.items():
+                f.write(json.dumps(_summary_entry(guild_id, counts, info["first_ts"], info["last_ts"]), ensure_ascii=False) + "\n")
+        os.replace(archive + ".tmp", archive)
+        info.update(count=len(counts_by_guild), summarized=True, targets=set(), moderators=set(), actions={"summary"}, guilds=set(counts_by_guild))
+    if candidates:
+        _save_log_manifest()
+        print(f"DEBUG: {len(candidates)} segment(s) du journal compacté(s) (mode {LOG_COMPACTION_MODE}).")
+    return len(candidates)
+
+@tasks.loop(hours=24)
+async def log_compaction_loop():
+    try:
+        await persistence.call(compact_logs)
+    except Exception as e:
+        print(f"Erreur lors du compactage du journal d'audit : {e}")
 
 # --- Fonctions du Système d'Avertissement ---
+# Les avertissements sont rangés par serveur : {guild_id: {user_id: [avertissements]}}.
+# Ceux de l'ancien format (sans serveur) sont gardés sous UNSCOPED_WARNS et rattachés au premier
+# serveur qui consulte ou modifie les avertissements du membre.
+# Les avertissements sont chargés une seule fois en mémoire et servis depuis le cache.
+# Chaque modification marque le cache comme modifié ; warns_flush_loop l'écrit ensuite en lot
+# (fichier temporaire + renommage atomique) via le travailleur de persistance, sans bloquer la boucle.
+# Avec le stockage SQLite, ce sont les opérations accumulées qui sont rejouées en une transaction.
+warns_cache = None
+warns_dirty = False
+_warn_ops = [] # Opérations en attente pour SQLite : ("add", guild_id, user_id, raison, date), ("remove", guild_id, user_id, date), ("reset", guild_id, user_id), ("claim", guild_id, user_id)
+UNSCOPED_WARNS = "unscoped"
+
+def _nest_legacy_warns(data):
+    """Ancien format {user_id: [...]} -> {UNSCOPED_WARNS: {user_id: [...]}} ; le nouveau format est rendu tel quel."""
+    if any(isinstance(value, list) for value in data.values()):
+        return {UNSCOPED_WARNS: data}
+    return data
+
+def _atomic_write_text(path, text):
+    """Écrit un fichier via un fichier temporaire puis un renommage, pour ne jamais le laisser à moitié écrit."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def init_warns():
+    """Charge les avertissements en mémoire (une seule fois)."""
+    global warns_cache
+    if warns_cache is not None:
+        return
+    if STORAGE_BACKEND == "sqlite":
+        init_db()
+        warns_cache = db_load_warns()
+        return
+    # Construites à part puis publiées d'un coup : la boucle ne voit jamais un cache à moitié chargé
+    data = {}
+    if os.path.exists(WARNS_FILE) and os.path.getsize(WARNS_FILE) > 0:
+        try:
+            with open(WARNS_FILE, "r", encoding="utf-8") as f:
+                data = _nest_legacy_warns(json.load(f))
+        except json.JSONDecodeError:
+            print(f"Warning: {WARNS_FILE} is corrupted. Il est conservé sous {WARNS_FILE}.corrupt.")
+            os.replace(WARNS_FILE, WARNS_FILE + ".corrupt")
+    warns_cache = data
+
+async def ensure_warns_loaded():
+    """À attendre avant d'utiliser les avertissements depuis la boucle : le chargement a lieu dans le travailleur."""
+    if warns_cache is None:
+        await persistence.call(init_warns)
+
 def load_warns():
-    """Charge les données d'avertissement du fichier JSON."""
-    init_warns()
-    with open(WARNS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_warns(data):
-    """Sauvegarde les données d'avertissement dans le fichier JSON."""
-    with open(WARNS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
-
-def add_warn(user_id, reason):
-    """Ajoute un avertissement à un utilisateur et retourne son nombre actuel d'avertissements."""
+    """Retourne les données d'avertissement (depuis la mémoire)."""
+    if warns_cache is None:
+        persistence.call_blocking(init_warns) # Accès avant ensure_warns_loaded : chargement dans le travailleur
+    return warns_cache
+
+def _mark_warns_dirty(op):
+    global warns_dirty
+    warns_dirty = True
+    if STORAGE_BACKEND == "sqlite":
+        _warn_ops.append(op)
+
+def get_user_warns(guild_id, user_id, create=False):
+    """
+    Liste (modifiable) des avertissements d'un membre sur un serveur, ou None s'il n'en a pas
+    et que create est faux. Ses éventuels avertissements de l'ancien format sont rattachés à ce serveur.
+    """
     warns = load_warns()
-    user_id_str = str(user_id)
-    warns.setdefault(user_id_str, []).append({"reason": reason, "timestamp": datetime.now(timezone.utc).isoformat()})
-    save_warns(warns)
-    return len(warns[user_id_str])
+    guild_key, user_key = str(guild_id), str(user_id)
+    guild_warns = warns.get(guild_key)
+    legacy = warns.get(UNSCOPED_WARNS)
+    if legacy and user_key in legacy:
+        guild_warns = warns.setdefault(guild_key, {})
+        guild_warns[user_key] = legacy.pop(user_key) + guild_warns.get(user_key, [])
+        _mark_warns_dirty(("claim", guild_key, user_key))
+    if create:
+        return warns.setdefault(guild_key, {}).setdefault(user_key, [])
+    return guild_warns.get(user_key) if guild_warns else None
+
+def add_warn(guild_id, user_id, reason):
+    """Ajoute un avertissement à un membre d'un serveur et retourne son nombre actuel d'avertissements sur ce serveur."""
+    user_warns = get_user_warns(guild_id, user_id, create=True)
+    timestamp = datetime.now(timezone.utc).isoformat()
+    user_warns.append({"reason": reason, "timestamp": timestamp})
+    _mark_warns_dirty(("add", str(guild_id), str(user_id), reason, timestamp))
+    return len(user_warns)
+
+def reset_warns(guild_id, user_id):
+    """Réinitialise tous les avertissements d'un membre sur un serveur."""
+    if get_user_warns(guild_id, user_id) is not None:
+        del load_warns()[str(guild_id)][str(user_id)]
+    _mark_warns_dirty(("reset", str(guild_id), str(user_id)))
+
+def remove_warn(guild_id, user_id, timestamp):
+    """Supprime un avertissement précis (identifié par sa date) ; retourne True s'il existait."""
+    user_warns = get_user_warns(guild_id, user_id) or []
+    for index, warn_entry in enumerate(user_warns):
+        if warn_entry["timestamp"] == timestamp:
+            del user_warns[index]
+            _mark_warns_dirty(("remove", str(guild_id), str(user_id), timestamp))
+            return True
+    return False
+
+def get_warns_count(guild_id, user_id):
+    """Retourne le nombre d'avertissements d'un membre sur un serveur."""
+    return len(get_user_warns(guild_id, user_id) or [])
+
+def _take_pending_warns():
+    """Retourne ce qu'il faut écrire depuis la dernière écriture (texte JSON ou opérations SQLite), sinon None."""
+    global warns_dirty, _warn_ops
+    if not warns_dirty:
+        return None
+    warns_dirty = False
+    if STORAGE_BACKEND == "sqlite":
+        pending, _warn_ops = _warn_ops, []
+        return pending
+    return json.dumps(warns_cache, indent=4)
+
+def _restore_pending_warns(pending):
+    """Remet en attente une écriture qui a échoué, pour la retenter au prochain passage."""
+    global warns_dirty
+    warns_dirty = True
+    if STORAGE_BACKEND == "sqlite":
+        _warn_ops[:0] = pending
+
+def _write_warns(pending):
+    if STORAGE_BACKEND == "sqlite":
+        db_apply_warn_ops(pending)
+    else:
+        _atomic_write_text(WARNS_FILE, pending)
+
+def flush_warns():
+    """Écrit immédiatement les avertissements en attente (utilisé à l'arrêt du bot)."""
+    pending = _take_pending_warns()
+    if pending is not None:
+        _write_warns(pending)
+
+@tasks.loop(seconds=WARNS_FLUSH_INTERVAL)
+async def warns_flush_loop():
+    """Écrit périodiquement les avertissements modifiés, via le travailleur de persistance."""
+    pending = _take_pending_warns()
+    if pending is None:
+        return
+    try:
+        await persistence.call(_write_warns, pending)
+    except Exception as e:
+        _restore_pending_warns(pending)
+        print(f"Erreur lors de l'écriture des avertissements : {e}")
+
+# --- Filtre de Mots Interdits ---
+# Toute la liste est compilée en une seule expression régulière construite comme un arbre de
+# préfixes (trie) : un message est analysé en une passe, quel que soit le nombre de mots.
+# Les messages et les mots sont d'abord normalisés (minuscules, accents, leetspeak).
+LEET_TABLE = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"})
+COMBINING_MARKS_RE = re.compile(r"[\u0300-\u036f]")
+bad_words_pattern = None
+
+def normalize_text(text):
+    """Met un texte sous forme comparable : minuscules, sans accents, leetspeak traduit."""
+    text = text.casefold()
+    if not text.isascii():
+        text = COMBINING_MARKS_RE.sub("", unicodedata.normalize("NFKD", text))
+    return text.translate(LEET_TABLE)
+
+def _trie_pattern(node):
+    """Convertit un nœud du trie en motif regex (les préfixes communs ne sont testés qu'une fois)."""
+    is_word_end = "" in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and not is_word_end:
+        return branches[0]
+    group = "(?:" + "|".join(branches) + ")"
+    return group + "?" if is_word_end else group
+
+def compile_bad_words(words, mode=BAD_WORDS_MODE):
+    """Construit l'expression régulière unique correspondant à la liste de mots interdits."""
+    trie = {}
+    for word in {normalize_text(w.strip()) for w in words if w.strip()}:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+    if not trie:
+        return None
+    pattern = _trie_pattern(trie)
+    if mode == "word":
+        pattern = rf"(?<!\w)(?:{pattern})(?!\w)"
+    return re.compile(pattern)
+
+def load_bad_words():
+    """(Re)charge la liste de mots interdits depuis BAD_WORDS_FILE et recompile le filtre."""
+    global bad_words, bad_words_pattern
+    if os.path.exists(BAD_WORDS_FILE):
+        try:
+            with open(BAD_WORDS_FILE, "r", encoding="utf-8") as f:
+                bad_words = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {BAD_WORDS_FILE} is corrupted. La liste actuelle est conservée.")
+    bad_words_pattern = compile_bad_words(bad_words)
+    return len(bad_words)
 
-def reset_warns(user_id):
-    """Réinitialise tous les avertissements d'un utilisateur spécifique."""
-    warns = load_warns()
-    warns[str(user_id)] = []
-    save_warns(warns)
+def contains_bad_word(normalized_content):
+    """Indique si un texte déjà normalisé contient un mot interdit."""
+    return bad_words_pattern is not None and bad_words_pattern.search(normalized_content) is not None
 
-def get_warns_count(user_id):
-    """Obtient le nombre actuel d'avertissements pour un utilisateur spécifique."""
-    warns = load_warns()
-    return len(warns.get(str(user_id), []))
+load_bad_words()
+
+# --- Suivi du Débit des Messages (Anti-Raid) ---
+class SlidingWindowRateTracker:
+    """
+    Compte les événements par clé sur une fenêtre glissante.
+    La mémoire est bornée : au plus max_keys clés, chacune avec au plus max_events horodatages.
+    Les clés inactives depuis plus d'une fenêtre sont évincées au fil de l'eau.
+    """
+    def __init__(self, max_events, window_seconds, max_keys):
+        self.max_events = max_events
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._events = OrderedDict() # clé -> deque d'horodatages, de la moins à la plus récemment active
+
+    def hit(self, key, now=None):
+        """Enregistre un événement et retourne True si la limite est atteinte dans la fenêtre."""
+        now = time.monotonic() if now is None else now
+        self._evict_expired(now)
+        events = self._events.get(key)
+        if events is None:
+            if len(self._events) >= self.max_keys:
+                self._events.popitem(last=False) # Éviction de la clé la moins récemment active
+            events = self._events[key] = deque(maxlen=self.max_events)
+        else:
+            self._events.move_to_end(key)
+        events.append(now)
+        return len(events) == self.max_events and now - events[0] < self.window_seconds
+
+    def reset(self, key):
+        self._events.pop(key, None)
+
+    def _evict_expired(self, now):
+        # Les clés sont rangées par dernière activité : on s'arrête à la première encore active
+        while self._events:
+            events = next(iter(self._events.values()))
+            if now - events[-1] < self.window_seconds:
+                break
+            self._events.popitem(last=False)
+
+    def __len__(self):
+        return len(self._events)
+
+class JoinRateDetector:
+    """
+    Fenêtre glissante des arrivées d'un serveur : se déclenche au bout de max_joins arrivées, ou de
+    max_new_accounts arrivées de comptes récents, en moins de window_seconds secondes.
+    La fenêtre est vidée à chaque déclenchement : elle ne dépasse jamais max_joins entrées.
+    """
+    def __init__(self, max_joins, max_new_accounts, window_seconds):
+        self.max_joins = max_joins
+        self.max_new_accounts = max_new_accounts
+        self.window_seconds = window_seconds
+        self._joins = deque() # (horodatage, ID du membre, nom, compte récent)
+        self._new_accounts = 0
+
+    def hit(self, member_id, name, new_account, now=None):
+        """Enregistre une arrivée et retourne True si le seuil de raid est atteint dans la fenêtre."""
+        now = time.monotonic() if now is None else now
+        while self._joins and now - self._joins[0][0] >= self.window_seconds:
+            self._new_accounts -= self._joins.popleft()[3]
+        self._joins.append((now, member_id, name, new_account))
+        self._new_accounts += new_account
+        return len(self._joins) >= self.max_joins or self._new_accounts >= self.max_new_accounts
+
+    def drain(self):
+        """Retire et retourne les arrivées de la fenêtre, sous la forme [(ID, nom)]."""
+        joins = [(member_id, name) for _, member_id, name, _ in self._joins]
+        self._joins.clear()
+        self._new_accounts = 0
+        return joins
+
+    def __len__(self):
+        return len(self._joins)
+
+# --- Configuration et État par Serveur ---
+# config.json contient les réglages globaux et une section "guilds" de réglages propres à chaque
+# serveur (prefix, anti_raid, raid_max_messages, raid_window_seconds, filter_exemptions, ...). Il est lu
+# une fois ; chaque modification est réécrite par le travailleur de persistance.
+# L'état vivant d'un serveur (anti-raid, suivi du débit, exemptions des filtres) est rangé dans un
+# GuildState, lui-même rangé par shard : un serveur n'influence jamais les réglages ou la mémoire
+# d'un autre, et les serveurs d'un shard peuvent être libérés ensemble.
+bot_config = None
+guild_states_by_shard = {} # {shard_id: {guild_id: GuildState}}
+
+def load_config():
+    """Charge CONFIG_FILE en mémoire (une seule fois)."""
+    global bot_config
+    if bot_config is not None:
+        return bot_config
+    bot_config = {}
+    if os.path.exists(CONFIG_FILE) and os.path.getsize(CONFIG_FILE) > 0:
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                bot_config = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {CONFIG_FILE} is corrupted. Les réglages par défaut sont utilisés.")
+    bot_config.setdefault("guilds", {})
+    return bot_config
+
+def get_guild_config(guild_id):
+    """Réglages propres à un serveur (dictionnaire vide s'il n'en a aucun)."""
+    return load_config()["guilds"].get(str(guild_id), {})
+
+def update_guild_config(guild_id, **changes):
+    """Modifie les réglages d'un serveur, les sauvegarde et reconstruit son état."""
+    config = load_config()
+    config["guilds"].setdefault(str(guild_id), {}).update(changes)
+    persistence.submit(_atomic_write_text, CONFIG_FILE, json.dumps(config, indent=4, ensure_ascii=False))
+    for states in guild_states_by_shard.values():
+        if guild_id in states:
+            states[guild_id].apply_config(get_guild_config(guild_id))
+
+def parse_prefixes(value):
+    """ "!,:" -> ("!", ":") ; les plus longs d'abord, pour que "!!" ne soit pas pris pour "!" suivi de "!"."""
+    prefixes = dict.fromkeys(prefix.strip() for prefix in str(value).split(",") if prefix.strip())
+    return tuple(sorted(prefixes, key=len, reverse=True)) or (PREFIX,)
+
+_default_prefixes = None
+
+def default_prefixes():
+    """Préfixes globaux (clé "prefix" de config.json), utilisés en message privé et par les serveurs sans réglage."""
+    global _default_prefixes
+    if _default_prefixes is None:
+        _default_prefixes = parse_prefixes(load_config().get("prefix") or PREFIX)
+    return _default_prefixes
+
+def _parse_exemption(spec):
+    return (frozenset(spec.get("roles", ())), frozenset(spec.get("channels", ())), spec.get("permission"))
+
+class GuildState:
+    """État vivant d'un serveur, construit à la première utilisation depuis sa configuration."""
+    __slots__ = ("guild_id", "prefixes", "anti_raid", "rate_tracker", "join_detector", "lockdown", "exemptions")
+
+    def __init__(self, guild_id, config):
+        self.guild_id = guild_id
+        self.rate_tracker = None
+        self.join_detector = None
+        self.lockdown = None # RaidLockdown en cours, le cas échéant
+        self.apply_config(config)
+
+    def apply_config(self, config):
+        self.prefixes = parse_prefixes(config["prefix"]) if config.get("prefix") else default_prefixes()
+        self.anti_raid = config.get("anti_raid", False)
+        max_events = config.get("raid_max_messages", RAID_MAX_MESSAGES)
+        window = config.get("raid_window_seconds", RAID_WINDOW_SECONDS)
+        tracker = self.rate_tracker
+        if tracker is None or (tracker.max_events, tracker.window_seconds) != (max_events, window):
+            self.rate_tracker = SlidingWindowRateTracker(max_events, window, RAID_TRACKER_MAX_USERS)
+        join_settings = (
+            config.get("raid_join_max", RAID_JOIN_MAX),
+            config.get("raid_join_max_new_accounts", RAID_JOIN_MAX_NEW_ACCOUNTS),
+            config.get("raid_join_window_seconds", RAID_JOIN_WINDOW_SECONDS),
+        )
+        detector = self.join_detector
+        if detector is None or (detector.max_joins, detector.max_new_accounts, detector.window_seconds) != join_settings:
+            self.join_detector = JoinRateDetector(*join_settings)
+        # Exemptions propres au serveur : {nom du filtre: (rôles, salons, permission)}
+        self.exemptions = {name: _parse_exemption(spec) for name, spec in config.get("filter_exemptions", {}).items()}
+
+def get_guild_state(guild):
+    states = guild_states_by_shard.get(guild.shard_id)
+    if states is None:
+        states = guild_states_by_shard[guild.shard_id] = {}
+    state = states.get(guild.id)
+    if state is None:
+        state = states[guild.id] = GuildState(guild.id, get_guild_config(guild.id))
+    return state
+
+def drop_guild_state(guild):
+    """Libère tout ce que le bot garde en mémoire pour un serveur quitté."""
+    state = guild_states_by_shard.get(guild.shard_id, {}).pop(guild.id, None)
+    if state is not None and state.lockdown is not None:
+        state.lockdown.stop()
+    for per_guild in (staff_index, ban_cache, _ban_cache_locks, muted_role_ids, _muted_role_locks):
+        per_guild.pop(guild.id, None)
+
+def _iter_guild_states():
+    for states in guild_states_by_shard.values():
+        yield from states.values()
+
+def get_prefixes(guild):
+    return get_guild_state(guild).prefixes if guild is not None else default_prefixes()
+
+def resolve_prefix(bot, message):
+    """command_prefix du bot : préfixes du serveur, servis depuis son GuildState (sans lecture de fichier)."""
+    return list(get_prefixes(message.guild))
+
+bot.command_prefix = resolve_prefix
+
+metric_gauges["guild_states"] = lambda: sum(len(states) for states in guild_states_by_shard.values())
+metric_gauges["raid_tracked_users"] = lambda: sum(len(state.rate_tracker) for state in _iter_guild_states())
+metric_gauges["raid_lockdowns"] = lambda: sum(1 for state in _iter_guild_states() if state.lockdown is not None)
+
+# --- Chaîne de Filtres des Messages ---
+# Chaque message d'un serveur traverse une liste de filtres triés par coût croissant. Le premier
+# filtre qui rend un verdict applique sa sanction et arrête la chaîne : un message n'est jamais
+# supprimé, journalisé ou sanctionné deux fois. La forme normalisée du contenu (normalize_text)
+# n'est calculée qu'une fois, et seulement si un filtre en a besoin. Un filtre ne s'applique pas
+# aux rôles, salons ou permissions déclarés dans FILTER_EXEMPTIONS.
+class FilterContext:
+    """Message en cours de filtrage, l'état de son serveur, et sa forme normalisée calculée à la demande."""
+    __slots__ = ("message", "state", "_normalized")
+
+    def __init__(self, message, state):
+        self.message = message
+        self.state = state
+        self._normalized = None
+
+    @property
+    def normalized(self):
+        if self._normalized is None:
+            self._normalized = normalize_text(self.message.content)
+        return self._normalized
+
+class MessageFilter:
+    """
+    Filtre de base. Les sous-classes définissent name, cost, check() (synchrone et sans appel
+    réseau : retourne un verdict, ou None pour laisser passer) et apply() (la sanction).
+    """
+    name = "filtre"
+    cost = 0 # Plus le coût est faible, plus le filtre passe tôt
+
+    def __init__(self, roles=(), channels=(), permission=None):
+        # Exemption par défaut ; un serveur peut la remplacer dans sa configuration (filter_exemptions)
+        self.exemption = _parse_exemption({"roles": roles, "channels": channels, "permission": permission})
+
+    def is_active(self, context):
+        return True
+
+    def is_exempt(self, message, exemption):
+        roles, channels, permission = exemption
+        author = message.author
+        if permission and getattr(author.guild_permissions, permission, False):
+            return True
+        if channels and message.channel.id in channels:
+            return True
+        return bool(roles) and any(role.id in roles for role in author.roles)
+
+    def check(self, context):
+        raise NotImplementedError
+
+    async def apply(self, message, verdict):
+        raise NotImplementedError
+
+class RaidFilter(MessageFilter):
+    """Spam rapide et comptes trop récents ; passe en premier pour que chaque message compte dans le débit."""
+    name = "anti_raid"
+    cost = 1
+
+    def is_active(self, context):
+        return context.state.anti_raid
+
+    def check(self, context):
+        author = context.message.author
+        if context.state.rate_tracker.hit(author.id):
+            return "spam"
+        if (datetime.now(timezone.utc) - author.created_at).total_seconds() < RAID_MIN_ACCOUNT_AGE_SECONDS:
+            return "new_account"
+        return None
+
+    async def apply(self, message, verdict):
+        author = message.author
+        if moderation_queue.is_recent(message.guild.id, author.id, "ban"):
+            return # Bannissement déjà demandé : il effacera aussi ce message
+        # La demande part avant tout await, pour que les messages suivants la voient déjà
+        reason = "Raid détecté : spam rapide" if verdict == "spam" else "Raid détecté : compte récent"
+        moderation_queue.submit(message.guild, author, "ban", reason=reason, log_type="antiraid_ban")
+        if verdict == "spam":
+            get_guild_state(message.guild).rate_tracker.reset(author.id)
+        notice = "Comportement suspect détecté. Message supprimé." if verdict == "spam" else "Compte trop récent. Banni pour sécurité."
+        try:
+            await message.delete()
+            await message.channel.send(f"{author.mention} : {notice}", delete_after=5)
+            print(f"DEBUG: Bannissement de {author} demandé ({verdict}).")
+        except discord.NotFound:
+            pass # Message déjà effacé par le bannissement
+        except discord.Forbidden:
+            print(f"Avertissement : Le bot n'a pas pu supprimer le message de {author} ({verdict}) (permissions manquantes).")
+        except Exception as e:
+            print(f"Erreur lors de la suppression anti-raid : {e}")
+
+class InviteFilter(MessageFilter):
+    """Liens d'invitation Discord (recherche d'une sous-chaîne dans le contenu normalisé)."""
+    name = "invites"
+    cost = 2
+
+    def check(self, context):
+        return "invite" if "discord.gg/" in context.normalized else None
+
+    async def apply(self, message, verdict):
+        try:
+            await message.delete()
+            await message.channel.send(f"🚫 {message.author.mention}, les liens d'invitation sont interdits.", delete_after=5)
+            log_action("auto-delete", bot.user, message.author, reason="Lien d'invitation interdit", details=message.content)
+            print(f"DEBUG: Message de {message.author} supprimé (lien d'invitation).")
+        except discord.Forbidden:
+            print(f"Avertissement : Le bot n'a pas pu supprimer le lien d'invitation de {message.author} dans {message.channel.name} (permissions manquantes).")
+        except Exception as e:
+            print(f"Erreur lors de l'anti-lien : {e}")
+
+class BadWordFilter(MessageFilter):
+    """Mots interdits (expression régulière compilée, sur le contenu normalisé)."""
+    name = "bad_words"
+    cost = 3
+
+    def check(self, context):
+        return "bad_word" if contains_bad_word(context.normalized) else None
+
+    async def apply(self, message, verdict):
+        try:
+            await message.delete()
+            await message.channel.send(f"🚫 {message.author.mention}, votre message contient un mot interdit.", delete_after=5)
+            log_action("auto-delete", bot.user, message.author, reason="Mot interdit", details=message.content)
+            print(f"DEBUG: Message de {message.author} supprimé (mot interdit).")
+        except discord.Forbidden:
+            print(f"Avertissement : Le bot n'a pas pu supprimer le message de mot interdit de {message.author} dans {message.channel.name} (permissions manquantes).")
+        except Exception as e:
+            print(f"Erreur lors de la modération des mots interdits : {e}")
+
+message_filters = []
+
+def register_filter(message_filter):
+    """Ajoute un filtre à la chaîne, en conservant l'ordre par coût."""
+    message_filters.append(message_filter)
+    message_filters.sort(key=lambda f: f.cost)
+
+for _filter_class in (RaidFilter, InviteFilter, BadWordFilter):
+    register_filter(_filter_class(**FILTER_EXEMPTIONS.get(_filter_class.name, {})))
+
+async def run_message_filters(message):
+    """Fait passer un message dans la chaîne ; retourne True si un filtre l'a sanctionné."""
+    state = get_guild_state(message.guild)
+    context = FilterContext(message, state)
+    for message_filter in message_filters:
+        if not message_filter.is_active(context):
+            continue
+        if message_filter.is_exempt(message, state.exemptions.get(message_filter.name, message_filter.exemption)):
+            continue
+        name = message_filter.name
+        increment(f"filter_{name}_checked")
+        with timed("on_message", f"filter:{name}"):
+            verdict = message_filter.check(context)
+        if verdict is None:
+            continue
+        increment(f"filter_{name}_hits")
+        with timed("on_message", f"action:{name}"):
+            await message_filter.apply(message, verdict)
+        return True
+    return False
+
+# --- File des Sanctions Automatiques ---
+# Les sanctions décidées par le bot (anti-raid, verrouillage, bannissement après MAX_WARNS) passent
+# par une file unique. Une sanction déjà demandée pour le même (serveur, membre, action) dans les
+# MODERATION_DEDUP_SECONDS secondes n'est pas rejouée : le demandeur reçoit le résultat de la
+# première, si elle est en cours ou a réussi. Une sanction échouée est oubliée et peut être
+# redemandée. Au plus MODERATION_CONCURRENCY sanctions s'exécutent à la fois ; une limite de débit
+# (429) ou une erreur serveur est retentée avec un délai croissant, un membre introuvable (404)
+# est considéré comme déjà traité. Les sourdines restent hors de la file : un tempmute manuel
+# doit toujours remplacer le précédent, ce que la déduplication empêcherait. Chaque sanction aboutit à un résultat : "done", "gone",
+# "forbidden" ou "failed".
+class ModerationQueue:
+    def __init__(self, concurrency, dedup_seconds, max_attempts):
+        self.concurrency = concurrency
+        self.dedup_seconds = dedup_seconds
+        self.max_attempts = max_attempts
+        self._queue = None # asyncio.Queue, créée avec la boucle d'événements
+        self._workers = []
+        self._recent = OrderedDict() # (serveur, membre, action) -> (échéance, Future du résultat)
+        self.in_flight = 0
+
+    def is_recent(self, guild_id, user_id, action):
+        self._expire(time.monotonic())
+        return (guild_id, user_id, action) in self._recent
+
+    def submit(self, guild, user, action, reason=None, log_type=None):
+        """
+        Demande une sanction ("ban" ou "kick") et retourne le Future
+        de son résultat. Si log_type est fourni, l'action est journalisée une fois, après succès.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        key = (guild.id, user.id, action)
+        recent = self._recent.get(key)
+        if recent is not None:
+            increment("moderation_deduplicated")
+            return recent[1]
+        future = asyncio.get_running_loop().create_future()
+        self._recent[key] = (now + self.dedup_seconds, future)
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._work()))
+        self._queue.put_nowait((guild, user, action, reason, log_type, future))
+        return future
+
+    def _expire(self, now):
+        # Une sanction en cours reste connue tant qu'elle n'est pas terminée, même au-delà de son échéance
+        while self._recent:
+            deadline, future = next(iter(self._recent.values()))
+            if deadline > now or not future.done():
+                break
+            self._recent.popitem(last=False)
+
+    async def _work(self):
+        while True:
+            guild, user, action, reason, log_type, future = await self._queue.get()
+            self.in_flight += 1
+            try:
+                outcome = await self._execute(guild, user, action, reason)
+            except Exception as e:
+                print(f"Erreur lors de la sanction automatique ({action} de {user}) : {e}")
+                outcome = "failed"
+            finally:
+                self.in_flight -= 1
+            increment(f"moderation_{outcome}")
+            key = (guild.id, user.id, action)
+            if outcome in ("forbidden", "failed") and self._recent.get(key, (None, None))[1] is future:
+                del self._recent[key] # Seuls les succès (et les sanctions en cours) sont dédupliqués
+            if outcome == "done" and log_type:
+                log_action(log_type, bot.user, user, reason, guild_id=guild.id)
+            if not future.done():
+                future.set_result(outcome)
+            self._queue.task_done()
+
+    async def _execute(self, guild, user, action, reason):
+        for attempt in range(self.max_attempts):
+            try:
+                if action == "ban":
+                    await guild.ban(user, reason=reason)
+                else:
+                    await guild.kick(user, reason=reason)
+                return "done"
+            except discord.NotFound:
+                return "gone" # Membre déjà parti ou compte supprimé : plus rien à faire
+            except discord.Forbidden:
+                print(f"Avertissement : Le bot n'a pas pu appliquer {action} à {user} (permissions manquantes).")
+                return "forbidden"
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"Erreur lors de la sanction automatique ({action} de {user}) : {e}")
+                    return "failed"
+                delay = 2 ** attempt
+                await asyncio.sleep(max(delay, _retry_after(e)) if e.status == 429 else delay)
+        return "failed"
+
+    async def drain(self):
+        """Attend la fin de toutes les sanctions déjà demandées."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def __len__(self):
+        return self._queue.qsize() + self.in_flight if self._queue is not None else 0
+
+moderation_queue = ModerationQueue(MODERATION_CONCURRENCY, MODERATION_DEDUP_SECONDS, MODERATION_MAX_ATTEMPTS)
+metric_gauges["moderation_queue"] = moderation_queue.__len__
+
+# --- Détection des Raids à l'Arrivée ---
+# Avec l'anti-raid activé, chaque arrivée passe par le JoinRateDetector du serveur. Quand il se
+# déclenche, le serveur entre en verrouillage : les arrivants de la fenêtre et tous les suivants
+# sont mis en file, puis traités par lots (un seul appel bulk_ban pour 200 bannissements, les
+# expulsions passant par la file des sanctions automatiques). Le
+# verrouillage se lève après RAID_LOCKDOWN_SECONDS secondes sans arrivée (ou avec !raid off) et
+# laisse une seule entrée de journal résumant le raid, au lieu d'une entrée par compte.
+class RaidLockdown:
+    def __init__(self, guild, joins):
+        self.guild = guild
+        self.started = time.monotonic()
+        self.last_join = self.started
+        self.pending = list(joins) # [(ID, nom)] en attente de traitement
+        self.handled = [] # [(ID, nom)] traités avec succès
+        self.failed = 0
+        self.stopped = False
+        self.task = None
+
+    def start(self):
+        increment("raid_lockdown")
+        print(f"DEBUG: Verrouillage anti-raid sur {self.guild.name} ({len(self.pending)} arrivées dans la fenêtre).")
+        self.task = run_in_background(self.run())
+
+    def enqueue(self, member):
+        self.pending.append((member.id, str(member)))
+        self.last_join = time.monotonic()
+
+    def stop(self):
+        """Lève le verrouillage après le traitement de la file en cours."""
+        self.stopped = True
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(RAID_LOCKDOWN_BATCH_SECONDS)
+                if self.pending:
+                    batch, self.pending = self.pending, []
+                    await self._act(batch)
+                if self.stopped or time.monotonic() - self.last_join >= RAID_LOCKDOWN_SECONDS:
+                    break
+        finally:
+            self._finish()
+
+    async def _act(self, batch):
+        reason = "Raid détecté : verrouillage à l'arrivée"
+        if RAID_LOCKDOWN_ACTION == "ban":
+            # Les comptes déjà en cours de bannissement par l'anti-raid des messages sont ignorés
+            batch = [join for join in batch if not moderation_queue.is_recent(self.guild.id, join[0], "ban")]
+            for start in range(0, len(batch), 200): # Limite de Discord par appel bulk_ban
+                chunk = batch[start:start + 200]
+                names = dict(chunk)
+                try:
+                    result = await self.guild.bulk_ban([discord.Object(id=member_id) for member_id, _ in chunk], reason=reason)
+                except discord.HTTPException as e:
+                    print(f"Avertissement : Bannissement groupé impossible sur {self.guild.name} : {e}")
+                    self.failed += len(chunk)
+                    continue
+                self.handled.extend((user.id, names.get(user.id)) for user in result.banned)
+                self.failed += len(result.failed)
+            return
+        outcomes = await asyncio.gather(*(
+            moderation_queue.submit(self.guild, discord.Object(id=member_id), "kick", reason=reason) for member_id, _ in batch
+        ))
+        for join, outcome in zip(batch, outcomes):
+            if outcome == "done":
+                self.handled.append(join)
+            elif outcome != "gone": # "gone" : déjà reparti
+                self.failed += 1
+
+    def _finish(self):
+        state = guild_states_by_shard.get(self.guild.shard_id, {}).get(self.guild.id)
+        if state is not None and state.lockdown is self:
+            state.lockdown = None
+        duration = round(time.monotonic() - self.started)
+        shown = ", ".join(f"{name} ({member_id})" for member_id, name in self.handled[:50])
+        more = f" et {len(self.handled) - 50} autres" if len(self.handled) > 50 else ""
+        log_action(
+            "antiraid_lockdown", bot.user,
+            reason=f"Raid à l'arrivée, verrouillage de {duration}s",
+            details=f"{len(self.handled)} comptes traités ({RAID_LOCKDOWN_ACTION}), {self.failed} échecs : {shown}{more}",
+            guild_id=self.guild.id
+        )
+        print(f"DEBUG: Fin du verrouillage anti-raid sur {self.guild.name} : {len(self.handled)} traités, {self.failed} échecs.")
+
+def watch_member_join(member):
+    """Alimente le détecteur d'arrivées du serveur, ou met l'arrivant en file pendant un verrouillage."""
+    state = get_guild_state(member.guild)
+    if not state.anti_raid or member.bot:
+        return
+    if state.lockdown is not None:
+        state.lockdown.enqueue(member)
+        return
+    new_account = (datetime.now(timezone.utc) - member.created_at).total_seconds() < RAID_JOIN_NEW_ACCOUNT_SECONDS
+    if state.join_detector.hit(member.id, str(member), new_account):
+        state.lockdown = RaidLockdown(member.guild, state.join_detector.drain())
+        state.lockdown.start()
 
 # --- Vérification des Permissions ---
 def is_admin():
@@ -129,6 +1707,215 @@ def parse_duration(duration_str):
     value, unit = int(match.group(1)), match.group(2)
     return value * {"s": 1, "m": 60, "h": 3600, "d": 86400}[unit]
 
+# --- Planificateur de Tâches Persistant ---
+# Les actions différées (fin de tempmute, tirage de giveaway, expiration d'avertissement) sont
+# rangées dans un tas binaire trié par échéance et sauvegardées dans JOBS_FILE. Une seule tâche,
+# job_dispatcher, dort jusqu'à la prochaine échéance puis exécute le gestionnaire du type de tâche.
+# Au redémarrage, les tâches échues pendant l'arrêt sont exécutées immédiatement. Une tâche en
+# cours reste sauvegardée jusqu'à la réussite de son gestionnaire ; en cas d'échec, elle est
+# replanifiée avec un délai croissant (JOB_RETRY_DELAY_SECONDS, doublé à chaque tentative).
+scheduled_jobs = [] # Tas de (échéance, id, tâche)
+running_jobs = {} # {id: tâche} en cours d'exécution, encore sauvegardées
+metric_gauges["scheduled_jobs"] = lambda: len(scheduled_jobs) + len(running_jobs)
+job_handlers = {} # {type de tâche: coroutine(payload)}
+_jobs_loaded = False
+_jobs_wakeup = None # asyncio.Event, réveille le répartiteur quand une tâche plus proche est ajoutée
+_job_dispatcher_task = None
+
+def job_handler(kind):
+    """Décorateur qui enregistre la coroutine à exécuter pour un type de tâche planifiée."""
+    def decorator(func):
+        job_handlers[kind] = func
+        return func
+    return decorator
+
+def load_jobs():
+    """Charge les tâches planifiées depuis JOBS_FILE (une seule fois)."""
+    global _jobs_loaded
+    if _jobs_loaded:
+        return
+    _jobs_loaded = True
+    if not os.path.exists(JOBS_FILE) or os.path.getsize(JOBS_FILE) == 0:
+        return
+    try:
+        with open(JOBS_FILE, "r", encoding="utf-8") as f:
+            jobs = json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: {JOBS_FILE} is corrupted. Il est conservé sous {JOBS_FILE}.corrupt.")
+        os.replace(JOBS_FILE, JOBS_FILE + ".corrupt")
+        return
+    scheduled_jobs.extend((job["due"], job["id"], job) for job in jobs)
+    heapq.heapify(scheduled_jobs)
+
+def save_jobs():
+    jobs = [job for _, _, job in scheduled_jobs] + list(running_jobs.values())
+    persistence.submit(_atomic_write_text, JOBS_FILE, json.dumps(jobs, indent=4))
+
+def _wake_job_dispatcher():
+    if _jobs_wakeup is not None:
+        _jobs_wakeup.set()
+
+def schedule_job(kind, delay_seconds, payload):
+    """Planifie une tâche dans delay_seconds secondes ; retourne son identifiant."""
+    load_jobs()
+    job = {
+        "id": f"{time.time_ns():x}",
+        "kind": kind,
+        "due": time.time() + delay_seconds,
+        "payload": payload
+    }
+    heapq.heappush(scheduled_jobs, (job["due"], job["id"], job))
+    save_jobs()
+    _wake_job_dispatcher()
+    return job["id"]
+
+def cancel_jobs(kind, **match):
+    """Annule les tâches d'un type dont le payload contient les valeurs données ; retourne leur nombre."""
+    load_jobs()
+    kept = [item for item in scheduled_jobs
+            if item[2]["kind"] != kind or any(item[2]["payload"].get(k) != v for k, v in match.items())]
+    cancelled = len(scheduled_jobs) - len(kept)
+    running = [job_id for job_id, job in running_jobs.items()
+               if job["kind"] == kind and all(job["payload"].get(k) == v for k, v in match.items())]
+    for job_id in running:
+        del running_jobs[job_id] # Ne sera pas replanifiée si son exécution échoue
+    if cancelled or running:
+        scheduled_jobs[:] = kept
+        heapq.heapify(scheduled_jobs)
+        save_jobs()
+    return cancelled + len(running)
+
+async def _run_job(job):
+    handler = job_handlers.get(job["kind"])
+    if handler is None:
+        print(f"DEBUG: Aucun gestionnaire pour la tâche planifiée {job['kind']} ({job['id']}).")
+    else:
+        try:
+            await handler(job["payload"])
+        except Exception as e:
+            print(f"Erreur lors de l'exécution de la tâche planifiée {job['kind']} ({job['id']}) : {e}")
+            _retry_job(job)
+            return
+    if running_jobs.pop(job["id"], None) is not None:
+        save_jobs()
+
+def _retry_job(job):
+    if running_jobs.pop(job["id"], None) is None:
+        return # Annulée pendant son exécution
+    job["attempts"] = job.get("attempts", 0) + 1
+    if job["attempts"] >= JOB_MAX_ATTEMPTS:
+        print(f"Avertissement : Tâche planifiée {job['kind']} ({job['id']}) abandonnée après {job['attempts']} échecs.")
+    else:
+        job["due"] = time.time() + JOB_RETRY_DELAY_SECONDS * 2 ** (job["attempts"] - 1)
+        heapq.heappush(scheduled_jobs, (job["due"], job["id"], job))
+        _wake_job_dispatcher()
+    save_jobs()
+
+async def job_dispatcher():
+    """Boucle unique qui exécute les tâches arrivées à échéance."""
+    global _jobs_wakeup
+    _jobs_wakeup = asyncio.Event()
+    load_jobs()
+    while True:
+        now = time.time()
+        due_jobs = []
+        while scheduled_jobs and scheduled_jobs[0][0] <= now:
+            due_jobs.append(heapq.heappop(scheduled_jobs)[2])
+        for job in due_jobs:
+            running_jobs[job["id"]] = job # Toujours sauvegardée : retirée seulement après réussite
+            run_in_background(_run_job(job))
+        # Réveil au plus tard toutes les heures, pour rester juste si l'horloge système est ajustée
+        timeout = min(scheduled_jobs[0][0] - now, 3600) if scheduled_jobs else 3600
+        _jobs_wakeup.clear()
+        try:
+            await asyncio.wait_for(_jobs_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def start_job_dispatcher():
+    global _job_dispatcher_task
+    if _job_dispatcher_task is None or _job_dispatcher_task.done():
+        _job_dispatcher_task = asyncio.create_task(job_dispatcher())
+
+@bot.command()
+@is_admin()
+async def jobs(ctx):
+    """Affiche les tâches planifiées en attente pour ce serveur."""
+    load_jobs()
+    pending = sorted((item for item in scheduled_jobs if item[2]["payload"].get("guild_id") == ctx.guild.id), key=lambda item: item[:2])
+    embed = discord.Embed(
+        title="🗓️ Tâches planifiées",
+        description=f"**{len(pending)}** tâche(s) en attente." if pending else "Aucune tâche en attente.",
+        color=discord.Color.blue()
+    )
+    for due, job_id, job in pending[:15]:
+        embed.add_field(name=f"{job['kind']} · `{job_id}`", value=f"<t:{int(due)}:R> — {job['payload'].get('summary', '')}", inline=False)
+    if len(pending) > 15:
+        embed.set_footer(text=f"... et {len(pending) - 15} autre(s)")
+    await ctx.send(embed=embed)
+
+# --- Cache des Bannissements ---
+# La liste des bannissements d'un serveur n'est téléchargée qu'une fois (à la première recherche
+# par nom), puis tenue à jour par on_member_ban / on_member_unban. Une recherche par ID
+# interroge directement ce bannissement précis, sans lister les autres.
+# Chaque utilisateur est indexé sous nom#tag (y compris nom#0 pour les comptes migrés) et sous son
+# nom seul ; plusieurs utilisateurs peuvent partager un même nom seul, la recherche les renvoie tous.
+ban_cache = {} # {guild_id: {"by_id": {user_id: User}, "by_name": {nom en minuscules: {user_id: User}}}}
+_ban_cache_locks = {}
+
+def _ban_names(user):
+    return {user.name.lower(), f"{user.name}#{user.discriminator}".lower()}
+
+def _index_ban(cache, user):
+    cache["by_id"][user.id] = user
+    for name in _ban_names(user):
+        cache["by_name"].setdefault(name, {})[user.id] = user
+
+def _cache_ban(guild_id, user):
+    cache = ban_cache.get(guild_id)
+    if cache is None:
+        return # Pas encore chargé : le chargement complet l'inclura
+    _index_ban(cache, user)
+
+def _uncache_ban(guild_id, user):
+    cache = ban_cache.get(guild_id)
+    if cache is None:
+        return
+    cache["by_id"].pop(user.id, None)
+    for name in _ban_names(user):
+        users = cache["by_name"].get(name, {})
+        users.pop(user.id, None)
+        if not users:
+            cache["by_name"].pop(name, None)
+
+async def prime_ban_cache(guild):
+    """Télécharge une seule fois la liste des bannissements du serveur."""
+    if guild.id in ban_cache:
+        return
+    async with _ban_cache_locks.setdefault(guild.id, asyncio.Lock()):
+        if guild.id in ban_cache:
+            return
+        cache = {"by_id": {}, "by_name": {}}
+        async for entry in guild.bans(limit=None):
+            _index_ban(cache, entry.user)
+        ban_cache[guild.id] = cache
+        print(f"DEBUG: {len(cache['by_id'])} bannissements mis en cache pour {guild.name}.")
+
+async def find_banned_users(guild, identifier):
+    """
+    Retrouve les utilisateurs bannis correspondant à un ID (requête directe) ou à un nom / nom#tag
+    (cache). Retourne une liste : vide si personne, plusieurs utilisateurs si un nom seul est ambigu.
+    """
+    identifier = identifier.strip()
+    if identifier.isdigit():
+        try:
+            entry = await guild.fetch_ban(discord.Object(id=int(identifier)))
+        except discord.NotFound:
+            return []
+        return [entry.user]
+    await prime_ban_cache(guild)
+    return list(ban_cache[guild.id]["by_name"].get(identifier.lower(), {}).values())
+
 # --- Commandes de Modération ---
 @bot.command()
 @is_admin()
@@ -160,25 +1947,24 @@ async def ban(ctx, member: discord.Member, *, reason=None):
 @is_admin()
 async def unban(ctx, *, member_identifier):
     """Débannit un utilisateur par son nom#tag ou son ID."""
-    banned_users = await ctx.guild.bans()
     member_identifier = member_identifier.strip()
-
-    for ban_entry in banned_users:
-        user = ban_entry.user
-        if (f"{user.name}#{user.discriminator}".lower() == member_identifier.lower() or
-            str(user.id) == member_identifier):
-            try:
-                await ctx.guild.unban(user)
-                await ctx.send(f"✅ **{user}** a été débanni.")
-                log_action("unban", ctx.author, user)
-                return
-            except discord.Forbidden:
-                await ctx.send("❌ Je n'ai pas les permissions de faire ça. Veuillez vérifier mes rôles.")
-                return
-            except Exception as e:
-                await ctx.send(f"Erreur lors du débannissement : {e}")
-                return
-    await ctx.send(f"Utilisateur `{member_identifier}` introuvable dans la liste des bannissements.")
+    try:
+        users = await find_banned_users(ctx.guild, member_identifier)
+        if not users:
+            await ctx.send(f"Utilisateur `{member_identifier}` introuvable dans la liste des bannissements.")
+            return
+        if len(users) > 1:
+            candidates = ", ".join(f"`{user.name}#{user.discriminator}` ({user.id})" for user in users[:10])
+            await ctx.send(f"❌ Plusieurs utilisateurs bannis portent ce nom : {candidates}. Précisez le nom#tag ou l'ID.")
+            return
+        user = users[0]
+        await ctx.guild.unban(user)
+        await ctx.send(f"✅ **{user}** a été débanni.")
+        log_action("unban", ctx.author, user)
+    except discord.Forbidden:
+        await ctx.send("❌ Je n'ai pas les permissions de faire ça. Veuillez vérifier mes rôles.")
+    except Exception as e:
+        await ctx.send(f"Erreur lors du débannissement : {e}")
 
 @bot.command()
 @is_admin()
@@ -201,61 +1987,137 @@ async def clear(ctx, amount: int):
 @is_admin()
 async def warn(ctx, member: discord.Member, *, reason="Aucune raison fournie"):
     """Avertit un membre. Bannissement automatique après MAX_WARNS."""
-    count = add_warn(member.id, reason)
+    await ensure_warns_loaded()
+    count = add_warn(ctx.guild.id, member.id, reason)
+    if WARN_EXPIRY_SECONDS:
+        schedule_job("warn_expiry", WARN_EXPIRY_SECONDS, {
+            "guild_id": ctx.guild.id,
+            "user_id": member.id,
+            "timestamp": get_user_warns(ctx.guild.id, member.id)[-1]["timestamp"],
+            "summary": f"Expiration d'un avertissement de {member}"
+        })
     await ctx.send(f"⚠️ **{member}** a été averti (**{count}/{MAX_WARNS}**). Raison : **{reason}**")
     log_action("warn", ctx.author, member, reason)
     if count >= MAX_WARNS:
-        try:
-            await member.ban(reason=f"Bannissement automatique après {MAX_WARNS} avertissements")
+        outcome = await moderation_queue.submit(ctx.guild, member, "ban", reason=f"Bannissement automatique après {MAX_WARNS} avertissements", log_type="ban")
+        if outcome == "done":
             await ctx.send(f"🚫 **{member}** a été automatiquement banni après **{MAX_WARNS}** avertissements.")
-            log_action("ban", bot.user, member, f"Bannissement automatique après {MAX_WARNS} avertissements")
-        except discord.Forbidden:
+        elif outcome == "forbidden":
             await ctx.send(f"❌ Impossible de bannir {member} automatiquement (permissions manquantes).")
-        except Exception as e:
-            await ctx.send(f"Erreur lors du bannissement automatique : {e}")
+        elif outcome == "gone":
+            await ctx.send(f"ℹ️ {member} n'a pas été banni automatiquement : il a quitté le serveur ou son compte n'existe plus.")
+        elif outcome == "failed":
+            await ctx.send(f"Erreur lors du bannissement automatique de {member}, voir les journaux du bot.")
 
 @bot.command()
 @is_admin()
 async def unwarn(ctx, member: discord.Member):
     """Supprime tous les avertissements pour un membre."""
-    reset_warns(member.id)
+    await ensure_warns_loaded()
+    reset_warns(ctx.guild.id, member.id)
+    cancel_jobs("warn_expiry", guild_id=ctx.guild.id, user_id=member.id)
     await ctx.send(f"✅ Tous les avertissements pour **{member}** ont été supprimés.")
     log_action("unwarn", ctx.author, member)
 
+@job_handler("warn_expiry")
+async def expire_warn(payload):
+    await ensure_warns_loaded()
+    if remove_warn(payload["guild_id"], payload["user_id"], payload["timestamp"]):
+        log_action("warn_expired", bot.user, payload["user_id"], details=f"Avertissement du {payload['timestamp']} expiré", guild_id=payload["guild_id"])
+
+@bot.command()
+@is_admin()
+async def reloadwords(ctx):
+    """Recharge la liste des mots interdits depuis le fichier, sans redémarrer le bot."""
+    count = await persistence.call(load_bad_words)
+    await ctx.send(f"✅ Liste des mots interdits rechargée (**{count}** mots).")
+    log_action("reload_bad_words", ctx.author, details=f"{count} mots")
+
 # --- Système de Sourdine (Mute) ---
-# NOTE: Le mute à l'échelle du serveur en changeant les permissions de chaque canal est lourd.
-# Pour les grands serveurs, un rôle "Muet" avec des permissions spécifiques est préférable.
-# Cependant, pour garder la simplicité et la fonctionnalité, je maintiens la version actuelle.
-async def apply_server_mute(ctx, member):
-    """Applique une sourdine à l'échelle du serveur en définissant les permissions dans tous les canaux."""
-    for channel in ctx.guild.channels:
+# Un seul rôle "Muted" par serveur, dont les surcharges de permissions sont posées une fois dans
+# chaque salon (puis dans les nouveaux salons). Rendre muet ne coûte ensuite qu'un appel API
+# (ajout/retrait du rôle) et ne touche plus aux surcharges propres au membre.
+# Avec MUTE_MODE = "timeout", c'est l'exclusion temporaire native de Discord qui est utilisée.
+MAX_TIMEOUT_SECONDS = 28 * 86400 # Limite imposée par Discord pour une exclusion temporaire
+MUTED_OVERWRITE = discord.PermissionOverwrite(
+    send_messages=False, send_messages_in_threads=False, create_public_threads=False,
+    create_private_threads=False, add_reactions=False, speak=False
+)
+muted_role_ids = {} # {guild_id: role_id}
+_muted_role_locks = {} # Évite de créer deux rôles si deux mutes arrivent en même temps
+
+async def _sync_muted_overwrites(guild, role):
+    """Pose la surcharge du rôle Muted dans les salons qui ne l'ont pas encore (vérifié localement, sans appel API)."""
+    for channel in guild.channels:
+        if channel.overwrites_for(role) == MUTED_OVERWRITE:
+            continue
         try:
-            # Écraser les permissions pour empêcher d'envoyer des messages et de parler
-            await channel.set_permissions(member, send_messages=False, speak=False, add_reactions=False)
+            await channel.set_permissions(role, overwrite=MUTED_OVERWRITE, reason="Configuration du rôle de sourdine")
         except discord.Forbidden:
-            print(f"DEBUG: Impossible de définir les permissions de mute pour {member} dans {channel.name} (Forbidden).")
+            print(f"DEBUG: Impossible de configurer le rôle {role.name} dans {channel.name} (Forbidden).")
         except Exception as e:
-            print(f"DEBUG: Erreur lors de l'application du mute pour {member} dans {channel.name}: {e}")
-
-async def remove_server_mute(ctx, member):
-    """Supprime la sourdine à l'échelle du serveur en réinitialisant les permissions des canaux."""
-    for channel in ctx.guild.channels:
+            print(f"DEBUG: Erreur lors de la configuration du rôle {role.name} dans {channel.name}: {e}")
+
+async def get_muted_role(guild):
+    """Retourne le rôle Muted du serveur ; le crée et configure les salons lors du premier appel."""
+    role = guild.get_role(muted_role_ids.get(guild.id, 0))
+    if role is not None:
+        return role
+    async with _muted_role_locks.setdefault(guild.id, asyncio.Lock()):
+        role = guild.get_role(muted_role_ids.get(guild.id, 0))
+        if role is not None:
+            return role
+        role = discord.utils.get(guild.roles, name=MUTED_ROLE_NAME)
+        if role is None:
+            role = await guild.create_role(name=MUTED_ROLE_NAME, reason="Rôle de sourdine géré par le bot")
+            print(f"DEBUG: Rôle '{MUTED_ROLE_NAME}' créé sur {guild.name}.")
+        await _sync_muted_overwrites(guild, role)
+        muted_role_ids[guild.id] = role.id
+        return role
+
+async def apply_server_mute(member, seconds=None, reason=None):
+    """Rend un membre muet sur tout le serveur (rôle Muted ou exclusion temporaire selon MUTE_MODE)."""
+    if MUTE_MODE == "timeout":
+        # Sans durée, on applique la durée maximale autorisée par Discord
+        seconds = min(seconds or MAX_TIMEOUT_SECONDS, MAX_TIMEOUT_SECONDS)
+        await member.timeout(timedelta(seconds=seconds), reason=reason)
+        return
+    role = await get_muted_role(member.guild)
+    await member.add_roles(role, reason=reason)
+
+async def remove_server_mute(member):
+    """Lève la sourdine d'un membre (y compris celle posée par l'ancien système de surcharges par salon)."""
+    await _remove_legacy_mute_overwrites(member)
+    if MUTE_MODE == "timeout":
+        await member.timeout(None)
+        return
+    # Simple recherche : lever une sourdine ne doit pas créer ni configurer le rôle
+    role = member.guild.get_role(muted_role_ids.get(member.guild.id, 0)) or discord.utils.get(member.guild.roles, name=MUTED_ROLE_NAME)
+    if role is not None and role in member.roles:
+        await member.remove_roles(role)
+
+async def _remove_legacy_mute_overwrites(member):
+    """Retire les surcharges de membre (send_messages, speak, add_reactions refusés) des anciens !mute."""
+    for channel in member.guild.channels:
+        overwrite = channel.overwrites_for(member) # Vérifié localement, sans appel API
+        if overwrite.send_messages is not False:
+            continue
+        overwrite.update(send_messages=None, speak=None, add_reactions=None)
         try:
-            # Effacer toutes les surcharges spécifiques pour le membre dans ce canal
-            await channel.set_permissions(member, overwrite=None)
-        except discord.Forbidden:
-            print(f"DEBUG: Impossible de réinitialiser les permissions de mute pour {member} dans {channel.name} (Forbidden).")
-        except Exception as e:
-            print(f"DEBUG: Erreur lors de la suppression du mute pour {member} dans {channel.name}: {e}")
+            await channel.set_permissions(member, overwrite=None if overwrite.is_empty() else overwrite)
+        except discord.HTTPException as e:
+            print(f"DEBUG: Impossible de retirer l'ancienne sourdine de {member} dans {channel.name}: {e}")
 
 @bot.command()
 @is_admin()
 async def mute(ctx, member: discord.Member, *, reason=None):
     """Rend un membre muet sur tout le serveur."""
     try:
-        await apply_server_mute(ctx, member)
+        await apply_server_mute(member, reason=reason)
         await ctx.send(f"🔇 **{member.mention}** a été rendu muet. Raison : {reason or 'Aucune'}")
         log_action("mute", ctx.author, member, reason)
+    except discord.Forbidden:
+        await ctx.send("❌ Je n'ai pas les permissions de faire ça. Veuillez vérifier mes rôles.")
     except Exception as e:
         await ctx.send(f"Erreur lors du mute : {e}")
 
@@ -264,9 +2126,12 @@ async def mute(ctx, member: discord.Member, *, reason=None):
 async def unmute(ctx, member: discord.Member):
     """Rend un membre non muet sur tout le serveur."""
     try:
-        await remove_server_mute(ctx, member)
+        await remove_server_mute(member)
+        cancel_jobs("unmute", guild_id=ctx.guild.id, member_id=member.id)
         await ctx.send(f"🔊 **{member.mention}** n'est plus muet.")
         log_action("unmute", ctx.author, member)
+    except discord.Forbidden:
+        await ctx.send("❌ Je n'ai pas les permissions de faire ça. Veuillez vérifier mes rôles.")
     except Exception as e:
         await ctx.send(f"Erreur lors de l'unmute : {e}")
 
@@ -278,19 +2143,252 @@ async def tempmute(ctx, member: discord.Member, duration: str, *, reason=None):
     if seconds is None:
         await ctx.send("❌ Format de durée invalide. Utilisez : `10s`, `5m`, `1h`, `2d`")
         return
+    if MUTE_MODE == "timeout" and seconds > MAX_TIMEOUT_SECONDS:
+        # Discord plafonne l'exclusion temporaire : on refuse plutôt que d'annoncer une durée fausse
+        await ctx.send(f"❌ En mode exclusion temporaire, la durée maximale est de **{MAX_TIMEOUT_SECONDS // 86400} jours**.")
+        return
     try:
-        await apply_server_mute(ctx, member)
+        await apply_server_mute(member, seconds, reason)
+        cancel_jobs("unmute", guild_id=ctx.guild.id, member_id=member.id) # Un nouveau tempmute remplace le précédent
+        schedule_job("unmute", seconds, {
+            "guild_id": ctx.guild.id,
+            "member_id": member.id,
+            "channel_id": ctx.channel.id,
+            "duration": duration,
+            "summary": f"Fin de la sourdine de {member}"
+        })
         await ctx.send(f"⏳ **{member.mention}** a été rendu muet pour **{duration}**.")
         log_action("tempmute", ctx.author, member, reason, duration)
-        await asyncio.sleep(seconds)
-        # Vérifier si le membre est toujours dans le serveur avant de le rendre non muet
-        if member in ctx.guild.members:
-            await remove_server_mute(ctx, member)
-            await ctx.send(f"🔊 **{member.mention}** n'est plus muet après **{duration}**.")
-            log_action("tempunmute", bot.user, member, f"Sourdine temporaire terminée après {duration}")
     except Exception as e:
         await ctx.send(f"Erreur lors du tempmute : {e}")
 
+@job_handler("unmute")
+async def end_tempmute(payload):
+    guild = bot.get_guild(payload["guild_id"])
+    if guild is None:
+        return
+    # Vérifier si le membre est toujours dans le serveur avant de le rendre non muet
+    member = await resolve_member(guild, payload["member_id"])
+    if member is None:
+        return
+    await remove_server_mute(member)
+    channel = guild.get_channel(payload["channel_id"])
+    if channel is not None:
+        await channel.send(f"🔊 **{member.mention}** n'est plus muet après **{payload['duration']}**.")
+    log_action("tempunmute", bot.user, member, f"Sourdine temporaire terminée après {payload['duration']}")
+
+# --- Envoi de Message en Masse ---
+# Les membres sont servis par lots, dans l'ordre croissant de leur ID. La taille des lots suit
+# les limites de débit de Discord : +1 après un lot fluide, divisée par deux dès qu'un envoi a été
+# ralenti ou refusé (429, avec le délai Retry-After renvoyé). Après chaque lot, le dernier ID
+# traité est sauvegardé dans SENDALL_STATE_FILE : un redémarrage reprend juste après.
+mass_dm_dispatchers = {} # {guild_id: MassDMDispatcher} - un seul envoi en masse par serveur
+metric_gauges["mass_dm_running"] = lambda: len(mass_dm_dispatchers)
+
+def _load_sendall_states():
+    if not os.path.exists(SENDALL_STATE_FILE) or os.path.getsize(SENDALL_STATE_FILE) == 0:
+        return {}
+    try:
+        with open(SENDALL_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: {SENDALL_STATE_FILE} is corrupted. Les envois en cours ne seront pas repris.")
+        return {}
+
+def _save_sendall_states():
+    """Instantané pris sur la boucle, écrit par le travailleur de persistance ; retourne l'awaitable."""
+    states = {str(guild_id): dispatcher.state for guild_id, dispatcher in mass_dm_dispatchers.items()}
+    return persistence.call(_atomic_write_text, SENDALL_STATE_FILE, json.dumps(states, indent=4))
+
+def _retry_after(error):
+    """Délai demandé par Discord dans la réponse d'une erreur 429 (en secondes)."""
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 1)
+    except ValueError:
+        return 1.0
+
+class MassDMDispatcher:
+    def __init__(self, guild, state):
+        self.guild = guild
+        self.state = state
+        self.concurrency = 1
+        self._resume = asyncio.Event()
+        if state["status"] != "paused":
+            self._resume.set()
+        self._last_progress = 0
+        self.task = None
+
+    def start(self):
+        mass_dm_dispatchers[self.guild.id] = self
+        self.task = run_in_background(self.run())
+
+    def pause(self):
+        self.state["status"] = "paused"
+        self._resume.clear()
+
+    def resume(self):
+        self.state["status"] = "running"
+        self._resume.set()
+
+    def cancel(self):
+        self.state["status"] = "cancelled"
+        self._resume.set() # Réveille la boucle si elle était en pause, pour qu'elle s'arrête
+
+    def progress_embed(self):
+        state = self.state
+        titles = {
+            "running": "🚀 Envoi en masse en cours",
+            "paused": "⏸️ Envoi en masse en pause",
+            "cancelled": "🛑 Envoi en masse arrêté",
+            "failed": "❌ Envoi en masse interrompu par une erreur",
+            "done": "✅ Envoi en masse terminé"
+        }
+        embed = discord.Embed(
+            title=titles[state["status"]],
+            description=f"```\n{state['message']}\n```",
+            color=discord.Color.green() if state["status"] == "done" else discord.Color.orange()
+        )
+        embed.add_field(name="Envoyés", value=state["sent"], inline=True)
+        embed.add_field(name="Échecs", value=state["failed"], inline=True)
+        embed.add_field(name="Restants", value=max(state.get("total", 0) - state["sent"] - state["failed"], 0), inline=True)
+        return embed
+
+    async def _update_progress(self, force=False, view=discord.utils.MISSING):
+        now = time.monotonic()
+        if not force and now - self._last_progress < SENDALL_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        channel = self.guild.get_channel(self.state["channel_id"])
+        if channel is None:
+            return
+        try:
+            await channel.get_partial_message(self.state["status_message_id"]).edit(embed=self.progress_embed(), view=view)
+        except discord.HTTPException as e:
+            print(f"DEBUG: Impossible de mettre à jour la progression de l'envoi en masse : {e}")
+
+    async def _send_one(self, member):
+        """Envoie le DM à un membre ; retourne (envoyé, ralenti par Discord)."""
+        throttled = False
+        for _ in range(3):
+            started = time.monotonic()
+            try:
+                await member.send(self.state["message"])
+                return True, throttled or time.monotonic() - started > SENDALL_SLOW_SEND_SECONDS
+            except discord.Forbidden:
+                print(f"DEBUG: Impossible d'envoyer un DM à {member.name} (Forbidden).")
+                return False, throttled
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    print(f"DEBUG: Échec de l'envoi de DM à {member.name}: {e}")
+                    return False, throttled
+                throttled = True
+                await asyncio.sleep(_retry_after(e))
+            except Exception as e:
+                print(f"DEBUG: Échec de l'envoi de DM à {member.name}: {e}")
+                return False, throttled
+        return False, True
+
+    async def run(self):
+        try:
+            await self._send_all()
+        except asyncio.CancelledError:
+            raise # Arrêt du bot : l'état déjà sauvegardé permettra la reprise au redémarrage
+        except Exception as e:
+            print(f"Erreur lors de l'envoi en masse sur {self.guild.name} : {e}")
+            self.state["status"] = "failed"
+        finally:
+            # Quoi qu'il arrive, le serveur est libéré pour un prochain !sendall
+            mass_dm_dispatchers.pop(self.guild.id, None)
+        await self._finish()
+
+    async def _send_all(self):
+        state = self.state
+        # Membres retenus pour la durée de l'envoi seulement (hors cache avec CACHE_POLICY = "lean")
+        members_by_id = {m.id: m for m in await get_guild_members(self.guild) if not m.bot and m.id > state["cursor"]}
+        recipients = sorted(members_by_id)
+        if "total" not in state:
+            state["total"] = len(recipients)
+        index = 0
+        while index < len(recipients):
+            await self._resume.wait()
+            if state["status"] == "cancelled":
+                break
+            batch = recipients[index:index + self.concurrency]
+            members = [members_by_id[member_id] for member_id in batch]
+            results = await asyncio.gather(*(self._send_one(member) for member in members))
+            state["sent"] += sum(1 for sent, _ in results if sent)
+            state["failed"] += len(batch) - sum(1 for sent, _ in results if sent)
+            state["cursor"] = batch[-1]
+            index += len(batch)
+            if any(throttled for _, throttled in results):
+                self.concurrency = max(1, self.concurrency // 2)
+            else:
+                self.concurrency = min(SENDALL_MAX_CONCURRENCY, self.concurrency + 1)
+            await _save_sendall_states()
+            await self._update_progress()
+
+    async def _finish(self):
+        state = self.state
+        if state["status"] not in ("cancelled", "failed"):
+            state["status"] = "done"
+        await _save_sendall_states() # Le serveur n'est plus dans le registre : son état quitte le fichier
+        await self._update_progress(force=True, view=None)
+        channel = self.guild.get_channel(state["channel_id"])
+        summary = f"Message envoyé à **{state['sent']}** membres. Échecs : **{state['failed']}**"
+        try:
+            if channel is not None:
+                await channel.send(f"❌ Envoi en masse interrompu par une erreur. {summary}" if state["status"] == "failed" else f"✅ {summary}")
+        except discord.HTTPException as e:
+            print(f"DEBUG: Impossible d'annoncer la fin de l'envoi en masse : {e}")
+        suffix = {"cancelled": " (arrêté)", "failed": " (interrompu par une erreur)"}.get(state["status"], "")
+        log_action("mass_dm", state["author"], details=f"Envoyé à {state['sent']} membres, {state['failed']} échecs{suffix}", guild_id=self.guild.id)
+
+async def resume_mass_dms():
+    """Reprend les envois en masse interrompus par un redémarrage."""
+    for guild_id, state in (await persistence.call(_load_sendall_states)).items():
+        guild = bot.get_guild(int(guild_id))
+        if guild is None or guild.id in mass_dm_dispatchers:
+            continue
+        MassDMDispatcher(guild, state).start()
+        channel = guild.get_channel(state["channel_id"])
+        if channel is not None:
+            await channel.send(f"🔁 Reprise de l'envoi en masse après redémarrage (**{state['sent'] + state['failed']}** membres déjà traités).")
+
+# --- Vue de Contrôle d'un Envoi en Masse ---
+class MassDMControlView(View):
+    def __init__(self):
+        super().__init__(timeout=None) # Persistante : reste utilisable après un redémarrage
+
+    async def _get_dispatcher(self, interaction):
+        dispatcher = mass_dm_dispatchers.get(interaction.guild.id)
+        if dispatcher is None:
+            await interaction.response.send_message("Aucun envoi en masse en cours.", ephemeral=True)
+            return None
+        if interaction.user.id != dispatcher.state["author_id"] and not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("❌ Ce bouton n'est pas pour vous.", ephemeral=True)
+            return None
+        return dispatcher
+
+    @discord.ui.button(label="Pause / Reprendre", style=discord.ButtonStyle.blurple, custom_id="sendall_pause_button")
+    async def pause_button(self, interaction: discord.Interaction, button: Button):
+        dispatcher = await self._get_dispatcher(interaction)
+        if dispatcher is None:
+            return
+        if dispatcher.state["status"] == "paused":
+            dispatcher.resume()
+        else:
+            dispatcher.pause()
+        await interaction.response.edit_message(embed=dispatcher.progress_embed())
+
+    @discord.ui.button(label="Arrêter l'envoi", style=discord.ButtonStyle.red, custom_id="sendall_cancel_button")
+    async def cancel_button(self, interaction: discord.Interaction, button: Button):
+        dispatcher = await self._get_dispatcher(interaction)
+        if dispatcher is None:
+            return
+        dispatcher.cancel()
+        await interaction.response.send_message("🛑 Arrêt de l'envoi après le lot en cours.", ephemeral=True)
+
 # --- Vue de Confirmation d'Envoi de Message en Masse ---
 class ConfirmSendView(View):
     def __init__(self, ctx, message):
@@ -309,33 +2407,28 @@ class ConfirmSendView(View):
         if self.confirmed: # Éviter les doubles clics
             await interaction.response.send_message("Cette action est déjà en cours ou a été complétée.", ephemeral=True)
             return
+        if self.ctx.guild.id in mass_dm_dispatchers:
+            await interaction.response.send_message("❌ Un envoi en masse est déjà en cours sur ce serveur.", ephemeral=True)
+            return
         self.confirmed = True
 
         await interaction.response.send_message("🚀 Envoi en cours...", ephemeral=True) # Répondre à l'interaction rapidement
 
-        count, failed = 0, 0
-        # Désactiver les boutons après le clic pour éviter les problèmes
-        self.children[0].disabled = True
-        self.children[1].disabled = True
-        await interaction.message.edit(view=self)
-
-        for member in self.ctx.guild.members:
-            if member.bot:
-                continue
-            try:
-                await member.send(self.message)
-                count += 1
-                await asyncio.sleep(0.5) # Petite pause pour éviter le rate limit de Discord
-            except discord.Forbidden:
-                failed += 1
-                print(f"DEBUG: Impossible d'envoyer un DM à {member.name} (Forbidden).")
-            except Exception as e:
-                failed += 1
-                print(f"DEBUG: Échec de l'envoi de DM à {member.name}: {e}")
-
-        await self.ctx.send(f"✅ Message envoyé à **{count}** membres. Échecs : **{failed}**")
-        log_action("mass_dm", self.ctx.author, details=f"Envoyé à {count} membres, {failed} échecs")
-        self.stop() # Arrêter la vue après l'envoi
+        dispatcher = MassDMDispatcher(self.ctx.guild, {
+            "status": "running",
+            "message": self.message,
+            "author": str(self.ctx.author),
+            "author_id": self.ctx.author.id,
+            "channel_id": interaction.channel.id,
+            "status_message_id": interaction.message.id,
+            "cursor": 0, # Dernier ID de membre traité
+            "sent": 0,
+            "failed": 0
+        })
+        dispatcher.start()
+        # Le message de confirmation devient le suivi de progression, avec les boutons pause/arrêt
+        await interaction.message.edit(embed=dispatcher.progress_embed(), view=MassDMControlView())
+        self.stop()
 
     @discord.ui.button(label="Annuler", style=discord.ButtonStyle.red)
     async def cancel(self, interaction: discord.Interaction, button: Button):
@@ -365,67 +2458,271 @@ async def sendall(ctx, *, message):
     await ctx.send(embed=embed, view=ConfirmSendView(ctx, message))
 
 # --- Système de Giveaways ---
-giveaways = {} # {message_id: {details}} - (Note : ceci n'est pas persistant après un redémarrage du bot)
+# Les participants sont enregistrés au fil des réactions (on_raw_reaction_add/remove) dans une
+# liste accompagnée d'un index de positions : ajout, retrait et tirage sont immédiats, sans
+# re-télécharger les réactions au moment du tirage. Les concours sont sauvegardés dans
+# GIVEAWAYS_FILE (écriture groupée, comme les avertissements) et conservés après la fin
+# pendant GIVEAWAY_RETENTION_SECONDS pour permettre un nouveau tirage (!reroll).
+giveaways = {} # {message_id: concours}
+_giveaway_positions = {} # {message_id: {user_id: position dans la liste des participants}}
+giveaways_dirty = False
+_giveaways_loaded = False
+
+def load_giveaways():
+    """Charge les concours depuis GIVEAWAYS_FILE (une seule fois)."""
+    global _giveaways_loaded
+    if _giveaways_loaded:
+        return
+    _giveaways_loaded = True
+    if not os.path.exists(GIVEAWAYS_FILE) or os.path.getsize(GIVEAWAYS_FILE) == 0:
+        return
+    try:
+        with open(GIVEAWAYS_FILE, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: {GIVEAWAYS_FILE} is corrupted. Il est conservé sous {GIVEAWAYS_FILE}.corrupt.")
+        os.replace(GIVEAWAYS_FILE, GIVEAWAYS_FILE + ".corrupt")
+        return
+    for giveaway_data in stored.values():
+        giveaways[giveaway_data["message_id"]] = giveaway_data
+        _giveaway_positions[giveaway_data["message_id"]] = {uid: i for i, uid in enumerate(giveaway_data["entrants"])}
+
+def _mark_giveaways_dirty():
+    global giveaways_dirty
+    giveaways_dirty = True
+
+def _add_entrant(giveaway_data, user_id):
+    positions = _giveaway_positions[giveaway_data["message_id"]]
+    if user_id in positions:
+        return
+    positions[user_id] = len(giveaway_data["entrants"])
+    giveaway_data["entrants"].append(user_id)
+    _mark_giveaways_dirty()
+
+def _remove_entrant(giveaway_data, user_id):
+    positions = _giveaway_positions[giveaway_data["message_id"]]
+    position = positions.pop(user_id, None)
+    if position is None:
+        return
+    # Retrait en O(1) : le dernier participant prend la place libérée
+    entrants = giveaway_data["entrants"]
+    last = entrants.pop()
+    if last != user_id:
+        entrants[position] = last
+        positions[last] = position
+    _mark_giveaways_dirty()
+
+def _take_giveaways_snapshot():
+    global giveaways_dirty
+    if not giveaways_dirty:
+        return None
+    giveaways_dirty = False
+    return json.dumps({str(message_id): data for message_id, data in giveaways.items()})
+
+def flush_giveaways():
+    snapshot = _take_giveaways_snapshot()
+    if snapshot is not None:
+        _atomic_write_text(GIVEAWAYS_FILE, snapshot)
+
+@tasks.loop(seconds=WARNS_FLUSH_INTERVAL)
+async def giveaways_flush_loop():
+    """Écrit périodiquement les concours modifiés, via le travailleur de persistance."""
+    snapshot = _take_giveaways_snapshot()
+    if snapshot is None:
+        return
+    try:
+        await persistence.call(_atomic_write_text, GIVEAWAYS_FILE, snapshot)
+    except Exception as e:
+        _mark_giveaways_dirty()
+        print(f"Erreur lors de l'écriture de {GIVEAWAYS_FILE} : {e}")
+
+async def _fetch_reaction_entrants(message):
+    """Liste complète des participants d'après les réactions (uniquement pour resynchroniser)."""
+    entrants = set()
+    for reaction in message.reactions:
+        if str(reaction.emoji) == GIVEAWAY_EMOJI:
+            async for user in reaction.users(limit=None):
+                if not user.bot:
+                    entrants.add(user.id)
+    return entrants
+
+giveaways_resynced = asyncio.Event() # Levé après le rattrapage du démarrage : les tirages l'attendent
+
+async def resync_giveaways():
+    """Au démarrage, rattrape les réactions ajoutées ou retirées pendant que le bot était arrêté."""
+    load_giveaways()
+    try:
+        for giveaway_data in list(giveaways.values()):
+            if giveaway_data["state"] != "running":
+                continue
+            channel = bot.get_channel(giveaway_data["channel_id"])
+            if channel is None:
+                continue
+            try:
+                message = await channel.fetch_message(giveaway_data["message_id"])
+                current = await _fetch_reaction_entrants(message)
+            except discord.HTTPException:
+                continue
+            for user_id in set(giveaway_data["entrants"]) - current:
+                _remove_entrant(giveaway_data, user_id)
+            for user_id in current:
+                _add_entrant(giveaway_data, user_id)
+    finally:
+        giveaways_resynced.set()
+
+def _draw_winners(giveaway_data, count, excluded=()):
+    """Tire au sort count gagnants distincts (hors excluded) ; ne parcourt pas la liste des participants."""
+    entrants = giveaway_data["entrants"]
+    excluded = set(excluded)
+    if len(entrants) - len(excluded) <= count:
+        return [uid for uid in entrants if uid not in excluded]
+    winners = set()
+    while len(winners) < count:
+        user_id = entrants[random.randrange(len(entrants))]
+        if user_id not in excluded:
+            winners.add(user_id)
+    return list(winners)
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    giveaway_data = giveaways.get(payload.message_id)
+    if giveaway_data is None or giveaway_data["state"] != "running" or str(payload.emoji) != GIVEAWAY_EMOJI:
+        return
+    if payload.user_id == bot.user.id or (payload.member is not None and payload.member.bot):
+        return
+    _add_entrant(giveaway_data, payload.user_id)
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    giveaway_data = giveaways.get(payload.message_id)
+    if giveaway_data is None or giveaway_data["state"] != "running" or str(payload.emoji) != GIVEAWAY_EMOJI:
+        return
+    _remove_entrant(giveaway_data, payload.user_id)
 
 @bot.command()
 @is_admin()
-async def giveaway(ctx, duration: str, *, prize):
-    """Démarre un concours pour une durée et un prix spécifiés."""
+async def giveaway(ctx, duration: str, winners: typing.Optional[int] = 1, *, prize):
+    """Démarre un concours pour une durée et un prix spécifiés (optionnellement avec plusieurs gagnants)."""
     seconds = parse_duration(duration)
     if seconds is None:
         await ctx.send("❌ Format de durée invalide. Utilisez : `10s`, `5m`, `1h`, `2d`")
         return
+    if not 1 <= winners <= 20:
+        await ctx.send("❌ Le nombre de gagnants doit être compris entre 1 et 20.")
+        return
+    load_giveaways()
     
     # Création d'un Embed plus esthétique pour le giveaway
     embed = discord.Embed(
         title="🎉 Giveaway en Cours ! 🎉",
-        description=f"Réagissez avec 🎉 pour tenter de gagner : **{prize}**",
+        description=f"Réagissez avec {GIVEAWAY_EMOJI} pour tenter de gagner : **{prize}**",
         color=discord.Color.gold()
     )
     embed.add_field(name="⏰ Durée restante", value=f"`{duration}`", inline=False)
+    if winners > 1:
+        embed.add_field(name="🏆 Gagnants", value=str(winners), inline=False)
     embed.set_footer(text=f"Organisé par {ctx.author.display_name}")
     embed.timestamp = datetime.now(timezone.utc)
 
     giveaway_message = await ctx.send(embed=embed)
-    await giveaway_message.add_reaction("🎉")
-
     giveaways[giveaway_message.id] = {
+        "guild_id": ctx.guild.id,
         "channel_id": ctx.channel.id,
-        "prize": prize,
-        "end_time": datetime.now(timezone.utc).timestamp() + seconds,
         "message_id": giveaway_message.id,
-        "guild_id": ctx.guild.id
+        "prize": prize,
+        "host": str(ctx.author),
+        "winners": winners,
+        "state": "running",
+        "entrants": [],
+        "winner_ids": []
     }
-    log_action("giveaway_start", ctx.author, details=f"Concours '{prize}' pour {duration}")
+    _giveaway_positions[giveaway_message.id] = {}
+    _mark_giveaways_dirty()
+    await giveaway_message.add_reaction(GIVEAWAY_EMOJI)
 
-    await asyncio.sleep(seconds)
+    # Le tirage est confié au planificateur : il survit à un redémarrage du bot
+    schedule_job("giveaway_end", seconds, {
+        "guild_id": ctx.guild.id,
+        "channel_id": ctx.channel.id,
+        "message_id": giveaway_message.id,
+        "prize": prize,
+        "host": str(ctx.author),
+        "summary": f"Tirage du concours '{prize}'"
+    })
+    log_action("giveaway_start", ctx.author, details=f"Concours '{prize}' pour {duration}")
 
-    try:
-        message = await ctx.channel.fetch_message(giveaway_message.id)
-    except discord.NotFound:
-        await ctx.send("Erreur : Le message du concours a été supprimé.")
+@job_handler("giveaway_end")
+async def end_giveaway(payload):
+    # Un concours terminé pendant l'arrêt est exécuté dès le démarrage : on tire parmi les
+    # participants rattrapés, pas parmi ceux de la dernière sauvegarde
+    await giveaways_resynced.wait()
+    channel = bot.get_channel(payload["channel_id"])
+    load_giveaways()
+    giveaway_data = giveaways.get(payload["message_id"])
+    if channel is None:
+        # Salon supprimé : aucun tirage à annoncer ni à relancer, le concours est clos et oublié
+        if giveaway_data is not None:
+            giveaway_data["state"] = "ended"
+            log_action("giveaway_end", giveaway_data["host"], details="Salon supprimé, aucun tirage", guild_id=giveaway_data["guild_id"])
+        await purge_giveaway(payload)
         return
-    except Exception:
-        await ctx.send("Erreur lors de la récupération du message du concours.")
+    if giveaway_data is None:
+        # Concours lancé avant le suivi des réactions : on relit les réactions une dernière fois
+        try:
+            message = await channel.fetch_message(payload["message_id"])
+        except discord.NotFound:
+            await channel.send("Erreur : Le message du concours a été supprimé.")
+            return
+        except Exception:
+            await channel.send("Erreur lors de la récupération du message du concours.")
+            return
+        giveaway_data = {**payload, "winners": 1, "state": "running", "entrants": list(await _fetch_reaction_entrants(message)), "winner_ids": []}
+        giveaways[payload["message_id"]] = giveaway_data
+        _giveaway_positions[payload["message_id"]] = {uid: i for i, uid in enumerate(giveaway_data["entrants"])}
+
+    prize = giveaway_data["prize"]
+    giveaway_data["state"] = "ended"
+    winner_ids = _draw_winners(giveaway_data, giveaway_data["winners"])
+    giveaway_data["winner_ids"] = winner_ids
+    _mark_giveaways_dirty()
+    schedule_job("giveaway_purge", GIVEAWAY_RETENTION_SECONDS, {"guild_id": giveaway_data["guild_id"], "message_id": giveaway_data["message_id"], "summary": f"Oubli du concours '{prize}'"})
+
+    if not winner_ids:
+        await channel.send("😢 Aucun participant pour le concours. Personne n'a gagné.")
+        log_action("giveaway_end", giveaway_data["host"], details="Aucun participant", guild_id=giveaway_data["guild_id"])
         return
 
-    users = set()
-    for reaction in message.reactions:
-        if str(reaction.emoji) == "🎉":
-            # await reaction.users().flatten() est déprécié, utilisez la méthode asynchrone
-            async for user in reaction.users():
-                if user.bot:
-                    continue
-                users.add(user)
+    mentions = ", ".join(f"<@{user_id}>" for user_id in winner_ids)
+    await channel.send(f"🎊 **Félicitations** {mentions} ! Vous avez gagné : **{prize}** 🎉")
+    log_action("giveaway_end", giveaway_data["host"], ", ".join(map(str, winner_ids)), details=f"Gagnant(s) : {mentions}, Prix : {prize}, Participants : {len(giveaway_data['entrants'])}", guild_id=giveaway_data["guild_id"])
 
-    if not users:
-        await ctx.send("😢 Aucun participant pour le concours. Personne n'a gagné.")
-        log_action("giveaway_end", ctx.author, details="Aucun participant")
-        return
+@job_handler("giveaway_purge")
+async def purge_giveaway(payload):
+    if giveaways.pop(payload["message_id"], None) is not None:
+        _giveaway_positions.pop(payload["message_id"], None)
+        _mark_giveaways_dirty()
 
-    winner = random.choice(list(users))
-    await ctx.send(f"🎊 **Félicitations** {winner.mention} ! Vous avez gagné : **{prize}** 🎉")
-    log_action("giveaway_end", ctx.author, winner, details=f"Gagnant : {winner.name}, Prix : {prize}")
+@bot.command()
+@is_admin()
+async def reroll(ctx, message_id: int, count: int = 1):
+    """Tire au sort de nouveaux gagnants pour un concours terminé, sans les gagnants précédents."""
+    load_giveaways()
+    giveaway_data = giveaways.get(message_id)
+    if giveaway_data is None or giveaway_data["guild_id"] != ctx.guild.id:
+        await ctx.send("❌ Concours introuvable (ou trop ancien).")
+        return
+    if giveaway_data["state"] != "ended":
+        await ctx.send("❌ Ce concours n'est pas encore terminé.")
+        return
+    winner_ids = _draw_winners(giveaway_data, count, excluded=giveaway_data["winner_ids"])
+    if not winner_ids:
+        await ctx.send("😢 Plus aucun participant disponible pour un nouveau tirage.")
+        return
+    giveaway_data["winner_ids"].extend(winner_ids)
+    _mark_giveaways_dirty()
+    mentions = ", ".join(f"<@{user_id}>" for user_id in winner_ids)
+    await ctx.send(f"🔁 Nouveau tirage ! **Félicitations** {mentions} ! Vous avez gagné : **{giveaway_data['prize']}** 🎉")
+    log_action("giveaway_reroll", ctx.author, ", ".join(map(str, winner_ids)), details=f"Prix : {giveaway_data['prize']}")
 
 # --- Commande de Sondage ---
 @bot.command()
@@ -447,6 +2744,278 @@ async def sondage(ctx, *, question):
         print(f"Avertissement: Impossible de supprimer le message de commande du sondage pour {ctx.author}.")
 
 
+# --- Accès aux Membres ---
+# Avec CACHE_POLICY = "lean", guild.members ne contient qu'une partie des membres : ces fonctions
+# complètent le cache par l'API (découpage à la demande, sans garder le résultat en cache).
+async def get_guild_members(guild):
+    """Liste complète des membres du serveur, depuis le cache s'il est complet."""
+    if guild.chunked:
+        return guild.members
+    with timed("gateway", "chunk_members"):
+        return await guild.chunk(cache=False)
+
+def is_member_target(target):
+    """Cible de surcharge désignant un membre, en cache (Member) ou non (Object de type User)."""
+    return isinstance(target, discord.Member) or getattr(target, "type", None) is discord.User
+
+async def resolve_member(guild, user_id):
+    """Membre du serveur par ID (cache puis API), ou None s'il n'en fait pas partie."""
+    member = guild.get_member(user_id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+    return member
+
+# --- Index des Membres du Staff ---
+# Pour chaque serveur, les membres ayant une permission de staff sont indexés une fois, puis
+# l'index est tenu à jour par les événements (rôles d'un membre, départs) et invalidé quand les
+# permissions d'un rôle changent. Trouver le staff ne parcourt donc plus tous les membres du serveur.
+# Sans cache complet, un membre mis à jour avant d'être en cache y entre sans événement : les
+# membres en cache sont donc aussi consultés, et leur version fait foi.
+STAFF_PERMISSIONS = ("administrator", "manage_channels", "manage_messages")
+staff_index = {} # {guild_id: {member_id: Member}}
+
+def _is_staff(member):
+    permissions = member.guild_permissions
+    return any(getattr(permissions, name) for name in STAFF_PERMISSIONS)
+
+async def _build_staff_index(guild):
+    members = await get_guild_members(guild)
+    staff_index[guild.id] = {member.id: member for member in members if _is_staff(member)}
+
+def _refresh_staff_member(member):
+    index = staff_index.get(member.guild.id)
+    if index is None:
+        return # Index pas encore construit : il le sera au premier besoin
+    if _is_staff(member):
+        index[member.id] = member
+    else:
+        index.pop(member.id, None)
+
+async def get_staff(guild, *permissions, include_bots=False):
+    """
+    Retourne les membres du staff ayant au moins une des permissions données
+    (par défaut : administrateur ou gérer les salons).
+    """
+    if guild.id not in staff_index:
+        await _build_staff_index(guild)
+    candidates = staff_index[guild.id]
+    if not guild.chunked:
+        candidates = {**candidates, **{member.id: member for member in guild.members}}
+    permissions = permissions or ("administrator", "manage_channels")
+    return [
+        member for member in candidates.values()
+        if (include_bots or not member.bot) and any(getattr(member.guild_permissions, name) for name in permissions)
+    ]
+
+# --- Envoi Groupé de Notifications ---
+# Les DMs au staff (nouveau ticket, retranscription, feedback) partent en parallèle, au plus
+# NOTIFY_CONCURRENCY à la fois, chacun limité à NOTIFY_TIMEOUT secondes, en arrière-plan :
+# la commande ou l'interaction n'attend plus la fin des envois pour continuer.
+_background_tasks = set() # Références fortes vers les tâches en arrière-plan
+metric_gauges["background_tasks"] = lambda: len(_background_tasks)
+
+def run_in_background(coro):
+    """Lance une coroutine sans l'attendre."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def fan_out(recipients, label, make_message):
+    """
+    Envoie un DM à chaque destinataire ; make_message() retourne les arguments de member.send
+    (appelée pour chaque envoi, afin qu'une pièce jointe ne soit jamais réutilisée).
+    Retourne le bilan {"sent", "forbidden", "timeout", "failed"}.
+    """
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+    async def send_one(member):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(member.send(**make_message()), NOTIFY_TIMEOUT)
+                return "sent"
+            except discord.Forbidden:
+                print(f"DEBUG: Impossible d'envoyer « {label} » en DM à {member.name} (Discord.Forbidden).")
+                return "forbidden"
+            except asyncio.TimeoutError:
+                print(f"DEBUG: Délai dépassé pour l'envoi de « {label} » à {member.name}.")
+                return "timeout"
+            except Exception as e:
+                print(f"DEBUG: Échec de l'envoi de « {label} » à {member.name}: {e}")
+                return "failed"
+
+    results = await asyncio.gather(*(send_one(member) for member in recipients))
+    summary = {outcome: results.count(outcome) for outcome in ("sent", "forbidden", "timeout", "failed")}
+    print(f"DEBUG: {label} : {summary['sent']} envoyé(s), {summary['forbidden']} refusé(s), {summary['timeout']} délai(s) dépassé(s), {summary['failed']} échec(s).")
+    return summary
+
+def notify_in_background(recipients, label, make_message, on_done=None):
+    """Lance fan_out en arrière-plan ; la coroutine on_done(bilan) est appelée à la fin."""
+    async def runner():
+        summary = await fan_out(recipients, label, make_message)
+        if on_done is not None:
+            await on_done(summary)
+    return run_in_background(runner())
+
+# --- Retranscription des Tickets ---
+# L'historique est parcouru au fil des pages renvoyées par Discord et écrit directement dans un
+# tampon en mémoire : pas de liste intermédiaire, pas de concaténations répétées, pas de fichier
+# partagé sur le disque. La retranscription est produite une seule fois par ticket.
+async def build_transcript(channel, closed_by):
+    """Construit la retranscription d'un ticket ; retourne {"text", "data", "filename"}."""
+    as_html = TRANSCRIPT_FORMAT == "html"
+    header = f"Retranscription du ticket {channel.name} fermé par {closed_by} le {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} (UTC):"
+    buffer = io.StringIO()
+    if as_html:
+        buffer.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(channel.name)}</title></head><body>\n<h1>{html.escape(header)}</h1>\n")
+    else:
+        buffer.write(header + "\n\n")
+    try:
+        async for msg in channel.history(limit=None, oldest_first=True):
+            time_str = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
+            if as_html:
+                buffer.write(f"<p><small>[{time_str}]</small> <b>{html.escape(msg.author.display_name)}</b>: {html.escape(msg.content)}</p>\n")
+            else:
+                buffer.write(f"[{time_str}] {msg.author.display_name}: {msg.content}\n")
+    except Exception as e:
+        buffer.write(f"\n--- ERREUR LORS DE LA RÉCUPÉRATION DES MESSAGES: {html.escape(str(e)) if as_html else e} ---\n")
+        print(f"DEBUG: Erreur lors de la récupération des messages pour la retranscription dans {channel.name}: {e}")
+    if as_html:
+        buffer.write("</body></html>\n")
+    text = buffer.getvalue()
+    data = text.encode("utf-8")
+    filename = f"transcript-{channel.name}.{'html' if as_html else 'txt'}"
+    if TRANSCRIPT_GZIP:
+        data = gzip.compress(data)
+        filename += ".gz"
+    return {"text": text, "data": data, "filename": filename}
+
+def transcript_message(channel_name, transcript):
+    """Arguments d'envoi d'une retranscription ; une nouvelle pièce jointe est créée à partir des mêmes octets à chaque appel."""
+    title = f"📄 **Retranscription du ticket pour {channel_name} :**"
+    # La limite de message Discord est de 2000 caractères : au-delà, on envoie un fichier
+    if TRANSCRIPT_FORMAT == "txt" and not TRANSCRIPT_GZIP and len(transcript["text"]) <= 1900:
+        return {"content": f"{title}\n```\n{transcript['text']}\n```"}
+    return {"content": title, "file": discord.File(io.BytesIO(transcript["data"]), filename=transcript["filename"])}
+
+# --- Registre des Tickets ---
+# Chaque ticket ouvert est indexé par salon et par créateur : retrouver le ticket d'un membre ou
+# le propriétaire d'un salon ne dépend plus du nom du salon (qui change avec !rename).
+# Le registre est sauvegardé dans TICKETS_FILE (ou la table tickets avec SQLite) et recoupé au
+# démarrage avec les salons de la catégorie TICKET_CATEGORY_NAME.
+tickets_by_channel = {} # {channel_id: ticket}
+tickets_by_creator = {} # {(guild_id, creator_id): channel_id}
+_tickets_loaded = False
+
+def _index_ticket(ticket):
+    tickets_by_channel[ticket["channel_id"]] = ticket
+    tickets_by_creator[(ticket["guild_id"], ticket["creator_id"])] = ticket["channel_id"]
+
+def _unindex_ticket(ticket):
+    tickets_by_channel.pop(ticket["channel_id"], None)
+    if tickets_by_creator.get((ticket["guild_id"], ticket["creator_id"])) == ticket["channel_id"]:
+        del tickets_by_creator[(ticket["guild_id"], ticket["creator_id"])]
+
+def load_tickets():
+    """Charge le registre des tickets ouverts (une seule fois)."""
+    global _tickets_loaded
+    if _tickets_loaded:
+        return
+    _tickets_loaded = True
+    if STORAGE_BACKEND == "sqlite":
+        init_db()
+        tickets = db_load_open_tickets()
+    elif os.path.exists(TICKETS_FILE) and os.path.getsize(TICKETS_FILE) > 0:
+        try:
+            with open(TICKETS_FILE, "r", encoding="utf-8") as f:
+                tickets = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {TICKETS_FILE} is corrupted. Le registre sera reconstruit depuis les salons.")
+            tickets = []
+    else:
+        tickets = []
+    for ticket in tickets:
+        _index_ticket(ticket)
+
+def save_tickets():
+    if STORAGE_BACKEND != "sqlite": # Avec SQLite, chaque changement est écrit directement dans la table
+        persistence.submit(_atomic_write_text, TICKETS_FILE, json.dumps(list(tickets_by_channel.values()), indent=4))
+
+def get_ticket(channel_id):
+    load_tickets()
+    return tickets_by_channel.get(channel_id)
+
+def get_open_ticket_for(guild_id, user_id):
+    load_tickets()
+    channel_id = tickets_by_creator.get((guild_id, user_id))
+    return tickets_by_channel.get(channel_id) if channel_id is not None else None
+
+def register_ticket(channel, creator_id, opened_at=None):
+    load_tickets()
+    ticket = {
+        "channel_id": channel.id,
+        "guild_id": channel.guild.id,
+        "creator_id": creator_id,
+        "state": "open",
+        "opened_at": opened_at or datetime.now(timezone.utc).isoformat(),
+        "claimed_by": None
+    }
+    _index_ticket(ticket)
+    if STORAGE_BACKEND == "sqlite":
+        persistence.submit(db_record_ticket_open, dict(ticket))
+    save_tickets()
+    return ticket
+
+def claim_ticket(ticket, member):
+    ticket["claimed_by"] = member.id
+    if STORAGE_BACKEND == "sqlite":
+        persistence.submit(db_record_ticket_claim, dict(ticket))
+    save_tickets()
+
+def close_ticket_record(channel_id, closed_by):
+    """Retire un ticket du registre des tickets ouverts."""
+    ticket = get_ticket(channel_id)
+    if ticket is None:
+        return
+    _unindex_ticket(ticket)
+    if STORAGE_BACKEND == "sqlite":
+        persistence.submit(db_record_ticket_close, channel_id, closed_by)
+    save_tickets()
+
+def _guess_ticket_creator(channel):
+    """Retrouve le créateur d'un salon de ticket absent du registre (nom ticket-ID ou surcharge de membre)."""
+    match = re.fullmatch(r"ticket-(\d+)", channel.name)
+    if match:
+        return int(match.group(1))
+    for target, overwrite in channel.overwrites.items():
+        # Seul le créateur reçoit attach_files à la création du ticket ; hors cache, la cible est un
+        # simple Object (le bot, lui, est toujours en cache et exclu ici)
+        if is_member_target(target) and overwrite.attach_files and not getattr(target, "bot", False):
+            return target.id
+    return None
+
+def rebuild_ticket_registry(guild):
+    """Recoupe le registre avec les salons de la catégorie des tickets de ce serveur."""
+    load_tickets()
+    category = discord.utils.get(guild.categories, name=TICKET_CATEGORY_NAME)
+    channels = {channel.id: channel for channel in category.text_channels} if category else {}
+    changed = False
+    for ticket in [t for t in tickets_by_channel.values() if t["guild_id"] == guild.id]:
+        if ticket["channel_id"] not in channels: # Salon supprimé pendant l'arrêt du bot
+            close_ticket_record(ticket["channel_id"], "inconnu (salon supprimé)")
+    for channel in channels.values():
+        if channel.id in tickets_by_channel:
+            continue
+        creator_id = _guess_ticket_creator(channel)
+        if creator_id is not None:
+            register_ticket(channel, creator_id, opened_at=channel.created_at.isoformat())
+            changed = True
+    if changed:
+        print(f"DEBUG: Registre des tickets reconstruit pour {guild.name} ({len(channels)} salons de ticket).")
+
 # --- Vues et Commandes du Système de Tickets ---
 
 # Vue pour la fermeture d'un ticket individuel
@@ -465,14 +3034,8 @@ class CloseTicketView(View):
         await interaction.message.edit(view=self)
 
         # Vérification des permissions de fermeture (créateur ou admin)
-        ticket_creator_id = None
-        if channel.name.startswith("ticket-"):
-            try:
-                # Extraire l'ID du créateur du nom du canal (ex: ticket-123456789)
-                ticket_creator_id = int(channel.name.split("-")[1])
-            except ValueError:
-                print(f"DEBUG: Nom de canal {channel.name} non standard, impossible d'extraire l'ID du créateur.")
-                pass # Le nom du canal n'est peut-être pas au format ticket-ID_UTILISATEUR
+        ticket_record = get_ticket(channel.id)
+        ticket_creator_id = ticket_record["creator_id"] if ticket_record else None
 
         # Seul le créateur du ticket ou un administrateur peut fermer
         if ticket_creator_id is not None and user_closing.id != ticket_creator_id and not user_closing.guild_permissions.administrator:
@@ -481,7 +3044,7 @@ class CloseTicketView(View):
             await interaction.message.edit(view=self)
             return
         elif ticket_creator_id is None and not user_closing.guild_permissions.administrator:
-            # Solution de repli si l'ID n'a pas pu être extrait ou nom non standard
+            # Salon absent du registre : seuls les administrateurs peuvent le fermer
             await interaction.response.send_message("❌ Vous n'avez pas la permission de fermer ce ticket.", ephemeral=True)
             self.children[0].disabled = False # Réactiver le bouton si la permission est refusée
             await interaction.message.edit(view=self)
@@ -493,46 +3056,23 @@ class CloseTicketView(View):
         log_action("ticket_close", user_closing, details=f"Ticket fermé : {channel.name} par le bouton")
 
         # --- Partie GESTION DE LA RETRANSCRIPTION ---
-        transcript = f"Retranscription du ticket {channel.name} fermé par {user_closing} le {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} (UTC):\n\n"
-        
-        try:
-            # Récupérer tous les messages du ticket, en ordre chronologique
-            messages = [msg async for msg in channel.history(limit=None, oldest_first=True)]
-            for msg in messages:
-                time_str = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                transcript += f"[{time_str}] {msg.author.display_name}: {msg.content}\n"
-        except Exception as e:
-            transcript += f"\n--- ERREUR LORS DE LA RÉCUPÉRATION DES MESSAGES: {e} ---\n"
-            print(f"DEBUG: Erreur lors de la récupération des messages pour la retranscription dans {channel.name}: {e}")
-
-        # Envoyer la retranscription à tous les administrateurs
-        admin_members_notified = 0
-        for member in guild.members:
-            # Vérifiez si le membre est un administrateur (ou a 'gérer les messages' comme staff) et n'est pas un bot
-            if (member.guild_permissions.administrator or member.guild_permissions.manage_messages) and not member.bot:
-                try:
-                    # Envoyer sous forme de fichier si la retranscription est trop longue pour un seul message
-                    if len(transcript) > 1900: # La limite de message Discord est de 2000 caractères
-                        # Créer un fichier temporaire
-                        with open("transcript.txt", "w", encoding="utf-8") as f:
-                            f.write(transcript)
-                        await member.send(f"📄 **Retranscription du ticket pour {channel.name} :**", file=discord.File("transcript.txt"))
-                        os.remove("transcript.txt") # Nettoyer le fichier après l'envoi
-                    else:
-                        await member.send(f"📄 **Retranscription du ticket pour {channel.name} :**\n```\n{transcript}\n```")
-                    admin_members_notified += 1
-                except discord.Forbidden:
-                    print(f"DEBUG: Impossible d'envoyer la retranscription en DM à l'administrateur {member.name} (Discord.Forbidden).")
-                except Exception as e:
-                    print(f"DEBUG: Échec de l'envoi de la retranscription à {member.name}: {e}")
-        
-        print(f"DEBUG: Retranscription envoyée à {admin_members_notified} administrateurs pour le ticket {channel.name}.")
+        # Construite une seule fois, puis envoyée à chaque administrateur sous la même forme
+        transcript = await build_transcript(channel, user_closing)
+
+        # Envoyer la retranscription à tous les administrateurs (en arrière-plan, la suppression n'attend pas)
+        notify_in_background(
+            await get_staff(guild, "administrator", "manage_messages"),
+            f"Retranscription du ticket {channel.name}",
+            lambda: transcript_message(channel.name, transcript)
+        )
         
         # --- Partie SUPPRESSION DU CANAL ---
         await asyncio.sleep(5) # Attendre 5 secondes comme promis
 
         try:
             await channel.delete(reason=f"Ticket fermé par {user_closing}")
+            # Retiré du registre seulement maintenant : si la suppression échoue, le ticket reste suivi
+            close_ticket_record(channel.id, user_closing)
             print(f"DEBUG: Canal {channel.name} supprimé avec succès.")
             self.stop() # Arrêter la vue après la suppression réussie
         except discord.Forbidden:
@@ -579,10 +3119,13 @@ class TicketCreationView(View):
                 return
 
         # Vérifier si l'utilisateur a déjà un ticket ouvert
-        existing_channel = discord.utils.get(guild.text_channels, name=f"ticket-{author.id}")
-        if existing_channel:
-            await interaction.followup.send(f"❌ Vous avez déjà un ticket ouvert : {existing_channel.mention}", ephemeral=True)
-            return
+        existing_ticket = get_open_ticket_for(guild.id, author.id)
+        if existing_ticket:
+            existing_channel = guild.get_channel(existing_ticket["channel_id"])
+            if existing_channel:
+                await interaction.followup.send(f"❌ Vous avez déjà un ticket ouvert : {existing_channel.mention}", ephemeral=True)
+                return
+            close_ticket_record(existing_ticket["channel_id"], "inconnu (salon supprimé)") # Entrée périmée
 
         # Définir les permissions pour le nouveau canal de ticket
         overwrites = {
@@ -591,10 +3134,9 @@ class TicketCreationView(View):
             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True), # Le bot voit, envoie, gère le canal
         }
         
-        # Ajouter les membres avec la permission 'gérer les messages' (ou administrateur) au ticket
-        for member in guild.members:
-            if member.guild_permissions.manage_channels or member.guild_permissions.administrator: # Manage_channels inclut la gestion des salons
-                overwrites[member] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        # Ajouter les membres du staff ('gérer les salons' ou administrateur) au ticket
+        for member in await get_staff(guild, include_bots=True):
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
 
         try:
             channel = await guild.create_text_channel(
@@ -608,18 +3150,12 @@ class TicketCreationView(View):
                 view=CloseTicketView()
             )
             await interaction.followup.send(f"✅ Votre ticket a été créé : {channel.mention}", ephemeral=True)
+            register_ticket(channel, author.id)
             log_action("ticket_create", author, details=f"Ticket créé via panel : {channel.name}")
 
             # Notifier les administrateurs et les modérateurs du nouveau ticket
             notification_msg = f"🆕 Nouveau ticket créé par {author.mention} ({author.id}) : {channel.mention}"
-            for member in guild.members:
-                if (member.guild_permissions.administrator or member.guild_permissions.manage_channels) and not member.bot:
-                    try:
-                        await member.send(notification_msg)
-                    except discord.Forbidden:
-                        print(f"DEBUG: Impossible d'envoyer la notification de nouveau ticket en DM à {member.name} (Discord.Forbidden).")
-                    except Exception as e:
-                        print(f"DEBUG: Échec de l'envoi de la notification à {member.name}: {e}")
+            notify_in_background(await get_staff(guild), f"Notification du ticket {channel.name}", lambda: {"content": notification_msg})
         
         except discord.Forbidden:
             await interaction.followup.send("❌ Je n'ai pas les permissions pour créer le canal de ticket. Veuillez vérifier mes rôles (notamment 'Gérer les salons').", ephemeral=True)
@@ -659,12 +3195,12 @@ async def ticket_panel(ctx):
 
 @bot.command()
 async def ticket(ctx, action=None):
-    """Gère les tickets : crée (via le panel) ou les ferme."""
+    """Gère les tickets : crée (via le panel), les prend en charge ou les ferme."""
     # Cette partie est maintenue pour le cas où quelqu'un tenterait d'utiliser !ticket close manuellement.
     # La création via !ticket est volontairement désactivée pour forcer l'utilisation du panel.
 
     if action is None:
-        await ctx.send("❌ Pour créer un ticket, veuillez utiliser le panel de tickets dans le salon approprié (`!ticketpanel`).", ephemeral=True)
+        await ctx.send(f"❌ Pour créer un ticket, veuillez utiliser le panel de tickets dans le salon approprié (`{ctx.clean_prefix}ticketpanel`).", ephemeral=True)
         return
 
     elif action.lower() == "close":
@@ -672,22 +3208,13 @@ async def ticket(ctx, action=None):
         guild = ctx.guild
         user_closing = ctx.author # L'utilisateur qui a tapé la commande
 
-        if not channel.name.startswith("ticket-"):
-            await ctx.send("❌ Cette commande (`!ticket close`) doit être utilisée dans un canal de ticket.", ephemeral=True)
+        ticket_record = get_ticket(channel.id)
+        if ticket_record is None:
+            await ctx.send(f"❌ Cette commande (`{ctx.clean_prefix}ticket close`) doit être utilisée dans un canal de ticket.", ephemeral=True)
             return
         
         # Vérification des permissions de fermeture (créateur ou admin)
-        ticket_creator_id = None
-        if channel.name.startswith("ticket-"):
-            try:
-                ticket_creator_id = int(channel.name.split("-")[1])
-            except ValueError:
-                pass # Le nom du canal n'est peut-être pas au format ticket-ID_UTILISATEUR
-
-        if ticket_creator_id is not None and user_closing.id != ticket_creator_id and not user_closing.guild_permissions.administrator:
-            await ctx.send("❌ Vous n'avez pas la permission de fermer ce ticket.", ephemeral=True)
-            return
-        elif ticket_creator_id is None and not user_closing.guild_permissions.administrator:
+        if user_closing.id != ticket_record["creator_id"] and not user_closing.guild_permissions.administrator:
             await ctx.send("❌ Vous n'avez pas la permission de fermer ce ticket.", ephemeral=True)
             return
 
@@ -696,39 +3223,19 @@ async def ticket(ctx, action=None):
         log_action("ticket_close", user_closing, details=f"Ticket fermé : {channel.name} par la commande")
 
         # --- Partie GESTION DE LA RETRANSCRIPTION ---
-        transcript = f"Retranscription du ticket {channel.name} fermé par {user_closing} le {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} (UTC):\n\n"
-        try:
-            messages = [msg async for msg in channel.history(limit=None, oldest_first=True)]
-            for msg in messages:
-                time_str = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                transcript += f"[{time_str}] {msg.author.display_name}: {msg.content}\n"
-        except Exception as e:
-            transcript += f"\n--- ERREUR LORS DE LA RÉCUPÉRATION DES MESSAGES: {e} ---\n"
-            print(f"DEBUG: Erreur lors de la récupération des messages pour la retranscription dans {channel.name}: {e}")
+        transcript = await build_transcript(channel, user_closing)
 
-        admin_members_notified = 0
-        for member in guild.members:
-            if (member.guild_permissions.administrator or member.guild_permissions.manage_channels) and not member.bot:
-                try:
-                    if len(transcript) > 1900:
-                        with open("transcript.txt", "w", encoding="utf-8") as f:
-                            f.write(transcript)
-                        await member.send(f"📄 **Retranscription du ticket pour {channel.name} :**", file=discord.File("transcript.txt"))
-                        os.remove("transcript.txt")
-                    else:
-                        await member.send(f"📄 **Retranscription du ticket pour {channel.name} :**\n```\n{transcript}\n```")
-                    admin_members_notified += 1
-                except discord.Forbidden:
-                    print(f"DEBUG: Impossible d'envoyer la retranscription en DM à l'administrateur {member.name} (Discord.Forbidden).")
-                except Exception as e:
-                    print(f"DEBUG: Échec de l'envoi de la retranscription à {member.name}: {e}")
-        
-        print(f"DEBUG: Retranscription envoyée à {admin_members_notified} administrateurs pour le ticket {channel.name}.")
+        notify_in_background(
+            await get_staff(guild),
+            f"Retranscription du ticket {channel.name}",
+            lambda: transcript_message(channel.name, transcript)
+        )
 
         await asyncio.sleep(5)
 
         try:
             await channel.delete(reason=f"Ticket fermé par {user_closing}")
+            close_ticket_record(channel.id, user_closing) # Après la suppression, comme pour le bouton
             print(f"DEBUG: Canal {channel.name} supprimé avec succès.")
         except discord.Forbidden:
             print(f"ERREUR CRITIQUE: Le bot n'a PAS les permissions pour supprimer le canal {channel.name} (discord.Forbidden).")
@@ -736,25 +3243,34 @@ async def ticket(ctx, action=None):
         except Exception as e:
             print(f"ERREUR INATTENDUE: Une erreur est survenue lors de la suppression du canal {channel.name} : {e}")
             await ctx.send(f"❌ **Erreur inattendue :** Une erreur est survenue lors de la suppression du canal '{channel.name}' : {e}", ephemeral=False)
+    elif action.lower() == "claim":
+        ticket_record = get_ticket(ctx.channel.id)
+        if ticket_record is None:
+            await ctx.send(f"❌ Cette commande (`{ctx.clean_prefix}ticket claim`) doit être utilisée dans un canal de ticket.", ephemeral=True)
+            return
+        if not (ctx.author.guild_permissions.administrator or ctx.author.guild_permissions.manage_channels):
+            await ctx.send("❌ Seul le staff peut prendre en charge un ticket.", ephemeral=True)
+            return
+        if ticket_record["claimed_by"] is not None and ticket_record["claimed_by"] != ctx.author.id:
+            await ctx.send(f"❌ Ce ticket est déjà pris en charge par <@{ticket_record['claimed_by']}>.", ephemeral=True)
+            return
+        claim_ticket(ticket_record, ctx.author)
+        await ctx.send(f"🙋 Ticket pris en charge par {ctx.author.mention}.")
+        log_action("ticket_claim", ctx.author, details=f"Ticket pris en charge : {ctx.channel.name}")
     else:
-        await ctx.send("❌ Utilisation : `!ticket close` ou utilisez le panneau de tickets.", ephemeral=True)
+        await ctx.send(f"❌ Utilisation : `{ctx.clean_prefix}ticket close`, `{ctx.clean_prefix}ticket claim` ou utilisez le panneau de tickets.", ephemeral=True)
 
 @bot.command()
 async def rename(ctx, *, new_name):
     """Renomme le canal de ticket actuel (uniquement pour les canaux de ticket)."""
     channel = ctx.channel
-    if not channel.name.startswith("ticket-"):
+    ticket_record = get_ticket(channel.id)
+    if ticket_record is None:
         await ctx.send("❌ Cette commande doit être utilisée dans un canal de ticket.")
         return
 
     # Vérifier si l'auteur est le créateur du ticket ou un administrateur
-    channel_id_part = channel.name.split("-")[1]
-    is_ticket_creator = False
-    try:
-        if int(channel_id_part) == ctx.author.id:
-            is_ticket_creator = True
-    except ValueError:
-        pass # Pas un nom de ticket standard
+    is_ticket_creator = ticket_record["creator_id"] == ctx.author.id
 
     if ctx.author.guild_permissions.administrator or is_ticket_creator:
         try:
@@ -829,20 +3345,14 @@ async def feedback(ctx, *, message):
     embed.set_author(name=str(ctx.author), icon_url=ctx.author.display_avatar.url)
     embed.timestamp = datetime.now(timezone.utc)
 
-    sent, failed = 0, 0
-    for member in ctx.guild.members:
-        # Envoyer le feedback aux administrateurs ou ceux qui peuvent gérer les canaux (staff général)
-        if (member.guild_permissions.administrator or member.guild_permissions.manage_channels) and not member.bot:
-            try:
-                await member.send(embed=embed)
-                sent += 1
-            except discord.Forbidden:
-                print(f"DEBUG: Impossible d'envoyer le feedback en DM à {member.name} (Forbidden).")
-                failed += 1
-            except Exception:
-                failed += 1
+    staff = await get_staff(ctx.guild)
+
+    async def report(summary):
+        failed = summary["forbidden"] + summary["timeout"] + summary["failed"]
+        await ctx.send(f"✅ Feedback envoyé à **{summary['sent']}** membre(s) du staff. **{failed}** échec(s).")
 
-    await ctx.send(f"✅ Feedback envoyé à **{sent}** membre(s) du staff. **{failed}** échec(s).")
+    notify_in_background(staff, "Feedback", lambda: {"embed": embed}, on_done=report)
+    await ctx.send(f"📨 Feedback en cours d'envoi à **{len(staff)}** membre(s) du staff.")
     log_action("feedback", ctx.author, details=message)
 
 @bot.command(name="userinfo")
@@ -887,7 +3397,7 @@ async def banid(ctx, user_id: int, *, reason=None):
 @is_admin()
 async def kickid(ctx, user_id: int, *, reason=None):
     """Expulse un utilisateur par son ID s'il est sur le serveur."""
-    member = ctx.guild.get_member(user_id) # Tente d'obtenir le membre directement
+    member = await resolve_member(ctx.guild, user_id) # Cache, puis API si le membre n'y est pas
     if member:
         try:
             await member.kick(reason=reason)
@@ -904,21 +3414,17 @@ async def kickid(ctx, user_id: int, *, reason=None):
 @is_admin()
 async def unbanid(ctx, user_id: int):
     """Débannit un utilisateur par son ID."""
-    banned_users = await ctx.guild.bans()
-    for entry in banned_users:
-        if entry.user.id == user_id:
-            try:
-                await ctx.guild.unban(entry.user)
-                await ctx.send(f"✅ **`{entry.user.name}#{entry.user.discriminator}`** (ID : `{user_id}`) a été débanni.")
-                log_action("unbanid", ctx.author, entry.user)
-                return
-            except discord.Forbidden:
-                await ctx.send(f"❌ Je n'ai pas les permissions pour débannir cet utilisateur.")
-                return
-            except Exception as e:
-                await ctx.send(f"Erreur lors du débannissement par ID : {e}")
-                return
-    await ctx.send(f"❌ Utilisateur avec l'ID `{user_id}` introuvable dans la liste des bannissements.")
+    try:
+        entry = await ctx.guild.fetch_ban(discord.Object(id=user_id)) # Un seul bannissement, pas la liste entière
+        await ctx.guild.unban(entry.user)
+        await ctx.send(f"✅ **`{entry.user.name}#{entry.user.discriminator}`** (ID : `{user_id}`) a été débanni.")
+        log_action("unbanid", ctx.author, entry.user)
+    except discord.NotFound:
+        await ctx.send(f"❌ Utilisateur avec l'ID `{user_id}` introuvable dans la liste des bannissements.")
+    except discord.Forbidden:
+        await ctx.send(f"❌ Je n'ai pas les permissions pour débannir cet utilisateur.")
+    except Exception as e:
+        await ctx.send(f"Erreur lors du débannissement par ID : {e}")
 
 @bot.command()
 @is_admin()
@@ -972,28 +3478,187 @@ async def slowmode(ctx, seconds: int):
     except Exception as e:
         await ctx.send(f"Erreur lors de la définition du mode lent : {e}")
 
+# --- Consultation du Journal d'Audit ---
+class ModLogsView(View):
+    """Pagination de !modlogs : les pages sont lues à la demande depuis le générateur de query_logs."""
+    def __init__(self, author, results, description):
+        super().__init__(timeout=180)
+        self.author = author
+        self.results = results
+        self.description = description
+        self.entries = [] # Entrées déjà lues, pour revenir en arrière sans relire le journal
+        self.exhausted = False
+        self.page = 0
+        self.message = None
+        self._lock = asyncio.Lock()
+
+    def _pull(self, count):
+        for _ in range(count):
+            try:
+                self.entries.append(next(self.results))
+            except StopIteration:
+                self.exhausted = True
+                return
+
+    async def load_page(self, page):
+        async with self._lock:
+            # Une entrée de plus que la page demandée pour savoir s'il existe une page suivante
+            needed = (page + 1) * MODLOGS_PAGE_SIZE + 1 - len(self.entries)
+            if needed > 0 and not self.exhausted:
+                await persistence.call(self._pull, needed)
+        self.page = page
+        self.previous_button.disabled = page == 0
+        self.next_button.disabled = len(self.entries) <= (page + 1) * MODLOGS_PAGE_SIZE
+
+    def build_embed(self):
+        embed = discord.Embed(
+            title="📜 Journal de modération",
+            description=self.description,
+            color=discord.Color.dark_gold()
+        )
+        start = self.page * MODLOGS_PAGE_SIZE
+        for entry in self.entries[start:start + MODLOGS_PAGE_SIZE]:
+            try:
+                date = datetime.fromisoformat(entry["timestamp"]).strftime('%d/%m/%Y %H:%M')
+            except (KeyError, TypeError, ValueError):
+                date = "date inconnue"
+            lines = [f"**Modérateur :** {_entry_moderator(entry) or 'Inconnu'}"]
+            if entry.get("target"):
+                lines.append(f"**Cible :** {entry['target']}")
+            if entry.get("duration"):
+                lines.append(f"**Durée :** {entry['duration']}")
+            if entry.get("reason"):
+                lines.append(f"**Raison :** {entry['reason']}")
+            if entry.get("details"):
+                details = str(entry["details"])
+                lines.append(f"**Détails :** {details[:200] + '…' if len(details) > 200 else details}")
+            embed.add_field(name=f"{entry.get('action')} — {date}", value="\n".join(lines)[:1024], inline=False)
+        if not self.entries:
+            embed.add_field(name="Aucun résultat", value="Aucune action ne correspond à ces filtres.", inline=False)
+        embed.set_footer(text=f"Page {self.page + 1}" + ("" if self.exhausted else " • résultats lus à la demande"))
+        return embed
+
+    async def _change_page(self, interaction, page):
+        if interaction.user != self.author:
+            await interaction.response.send_message("❌ Ce bouton n'est pas pour vous.", ephemeral=True)
+            return
+        await self.load_page(page)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="◀️ Précédent", style=discord.ButtonStyle.grey)
+    async def previous_button(self, interaction: discord.Interaction, button: Button):
+        await self._change_page(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="Suivant ▶️", style=discord.ButtonStyle.grey)
+    async def next_button(self, interaction: discord.Interaction, button: Button):
+        await self._change_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        self.previous_button.disabled = True
+        self.next_button.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+def _parse_log_time(value):
+    """'7d' (il y a 7 jours) ou '2025-06-01' (date UTC) -> datetime, None si invalide."""
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+async def _resolve_log_user(ctx, value):
+    """Valeurs sous lesquelles un utilisateur apparaît dans le journal : son nom (str) et son ID."""
+    try:
+        user = await commands.UserConverter().convert(ctx, value)
+    except commands.BadArgument:
+        return {value}
+    return {str(user), str(user.id)}
+
+@bot.command()
+@is_admin()
+async def modlogs(ctx, *filters):
+    """
+    Recherche dans le journal d'audit. Filtres (tous optionnels, combinables) :
+    cible:<membre> modo:<membre> action:<type> depuis:<7d|AAAA-MM-JJ> jusqua:<1d|AAAA-MM-JJ>
+    Un argument sans préfixe est interprété comme la cible.
+    """
+    query, description = {}, []
+    for item in filters:
+        key, sep, value = item.partition(":")
+        if not sep or not value:
+            key, value = "cible", item
+        key = key.lower()
+        if key in ("cible", "modo"):
+            query["targets" if key == "cible" else "moderators"] = await _resolve_log_user(ctx, value)
+        elif key == "action":
+            query["action"] = value.lower()
+        elif key in ("depuis", "jusqua"):
+            moment = _parse_log_time(value)
+            if moment is None:
+                await ctx.send(f"❌ Date invalide : `{value}`. Utilisez une durée (`7d`, `12h`) ou une date (`2025-06-01`).")
+                return
+            query["since" if key == "depuis" else "until"] = moment
+        else:
+            await ctx.send(f"❌ Filtre inconnu : `{key}`. Filtres disponibles : `cible`, `modo`, `action`, `depuis`, `jusqua`.")
+            return
+        description.append(f"**{key}** : {value}")
+
+    view = ModLogsView(ctx.author, query_logs(ctx.guild.id, **query), " • ".join(description) or "Toutes les actions")
+    await view.load_page(0)
+    view.message = await ctx.send(embed=view.build_embed(), view=view)
+
 # --- Commandes Anti-Raid ---
 @bot.command()
 @is_admin()
 async def raid(ctx, action: str):
     """
-    Active ou désactive le mode anti-raid.
+    Active ou désactive le mode anti-raid sur ce serveur (réglage conservé après un redémarrage).
     Usage: !raid on / !raid off
     """
-    global anti_raid_enabled
-
     if action.lower() == "on":
-        anti_raid_enabled = True
-        await ctx.send("🛡️ Mode anti-raid **activé**. Les comptes récents et les spammers rapides seront bannis.")
+        update_guild_config(ctx.guild.id, anti_raid=True)
+        get_guild_state(ctx.guild).anti_raid = True
+        await ctx.send("🛡️ Mode anti-raid **activé**. Les comptes récents et les spammers rapides seront bannis, une vague d'arrivées verrouille le serveur.")
         log_action("anti_raid", ctx.author, details="Activé")
     elif action.lower() == "off":
-        anti_raid_enabled = False
+        update_guild_config(ctx.guild.id, anti_raid=False)
+        state = get_guild_state(ctx.guild)
+        state.anti_raid = False
+        if state.lockdown is not None:
+            state.lockdown.stop()
         await ctx.send("🏳️ Mode anti-raid **désactivé**.")
         log_action("anti_raid", ctx.author, details="Désactivé")
     else:
-        await ctx.send("❌ Action invalide. Utilisez `!raid on` ou `!raid off`.")
+        await ctx.send(f"❌ Action invalide. Utilisez `{ctx.clean_prefix}raid on` ou `{ctx.clean_prefix}raid off`.")
 
 # --- Commandes Générales Utilitaires ---
+@bot.command()
+@is_admin()
+async def prefix(ctx, *, prefixes: str = None):
+    """
+    Affiche ou change les préfixes de ce serveur.
+    Usage: !prefix | !prefix ?,! (plusieurs préfixes séparés par des virgules) | !prefix reset
+    """
+    if prefixes is None:
+        await ctx.send(f"ℹ️ Préfixe(s) de ce serveur : {' '.join(f'`{p}`' for p in get_prefixes(ctx.guild))}")
+        return
+    if prefixes.lower() == "reset":
+        update_guild_config(ctx.guild.id, prefix=None)
+    elif any(len(p.strip()) > 10 for p in prefixes.split(",")):
+        await ctx.send("❌ Un préfixe ne peut pas dépasser 10 caractères.")
+        return
+    else:
+        update_guild_config(ctx.guild.id, prefix=",".join(parse_prefixes(prefixes)))
+    new_prefixes = get_prefixes(ctx.guild)
+    await ctx.send(f"✅ Préfixe(s) de ce serveur : {' '.join(f'`{p}`' for p in new_prefixes)}")
+    log_action("prefix_change", ctx.author, details=" ".join(new_prefixes), guild_id=ctx.guild.id)
+
 @bot.command()
 async def ping(ctx):
     """Affiche la latence du bot."""
@@ -1010,7 +3675,8 @@ async def server_info(ctx):
     )
     embed.set_thumbnail(url=guild.icon.url if guild.icon else None)
     embed.add_field(name="🆔 ID du serveur", value=guild.id, inline=True)
-    embed.add_field(name="👑 Propriétaire", value=guild.owner.mention, inline=True)
+    owner = guild.owner or await resolve_member(guild, guild.owner_id) # Hors cache avec CACHE_POLICY = "lean"
+    embed.add_field(name="👑 Propriétaire", value=owner.mention if owner else f"<@{guild.owner_id}>", inline=True)
     embed.add_field(name="🗓️ Créé le", value=guild.created_at.strftime('%d/%m/%Y %H:%M'), inline=True)
     embed.add_field(name="👥 Membres", value=guild.member_count, inline=True)
     embed.add_field(name="💬 Salons textuels", value=len(guild.text_channels), inline=True)
@@ -1041,118 +3707,192 @@ async def eight_ball(ctx, *, question: str):
     )
     await ctx.send(embed=embed)
 
+def _format_histograms(family, limit=10):
+    rows = sorted(
+        ((label, h) for (f, label), h in latency_histograms.items() if f == family),
+        key=lambda item: item[1].total, reverse=True
+    )[:limit]
+    if not rows:
+        return "Aucune mesure."
+    lines = [
+        f"`{label}` ×{h.count} — p50 {h.quantile(0.5) * 1000:.1f}ms, p99 {h.quantile(0.99) * 1000:.1f}ms, max {h.max * 1000:.0f}ms"
+        for label, h in rows
+    ]
+    return "\n".join(lines)[:1024]
+
+@bot.command()
+@is_admin()
+async def stats(ctx):
+    """Affiche les compteurs et les latences mesurées depuis le démarrage."""
+    uptime = timedelta(seconds=int(time.time() - metrics_started_at))
+    latency = f"**{round(bot.latency * 1000)}ms**"
+    if AUTO_SHARD:
+        latency += " (" + ", ".join(f"shard {shard_id} : {round(value * 1000)}ms" for shard_id, value in bot.latencies) + ")"
+    embed = discord.Embed(
+        title="📊 Statistiques du bot",
+        description=f"Depuis {uptime} • {len(bot.guilds)} serveurs • Latence passerelle : {latency}",
+        color=discord.Color.teal(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    counters = "\n".join(f"`{name}` : {value}" for name, value in metric_counters.most_common(15))
+    embed.add_field(name="🔢 Compteurs", value=counters[:1024] or "Aucun.", inline=True)
+    gauges = "\n".join(f"`{name}` : {func()}" for name, func in sorted(metric_gauges.items()))
+    embed.add_field(name="📦 En cours", value=gauges[:1024] or "Aucun.", inline=True)
+    filters = "\n".join(
+        f"`{f.name}` : {metric_counters[f'filter_{f.name}_hits']} sanctions / {metric_counters[f'filter_{f.name}_checked']} messages analysés"
+        for f in message_filters
+    )
+    embed.add_field(name="🧹 Filtres (par ordre de passage)", value=filters[:1024] or "Aucun.", inline=False)
+    embed.add_field(name="⌨️ Commandes (par temps total)", value=_format_histograms("command"), inline=False)
+    embed.add_field(name="💬 Étapes de on_message", value=_format_histograms("on_message"), inline=False)
+    embed.add_field(name="🌐 Appels REST", value=_format_histograms("rest"), inline=False)
+    embed.add_field(name="📡 Passerelle", value=_format_histograms("gateway"), inline=False)
+    embed.add_field(name="💾 Stockage", value=_format_histograms("storage"), inline=False)
+    await ctx.send(embed=embed)
+
 @bot.command()
 async def help(ctx):
     """Affiche toutes les commandes disponibles."""
     embed = discord.Embed(
         title="📚 Aide des commandes du bot",
-        description="Voici la liste de toutes les commandes disponibles (le préfixe est `!`) :",
+        description=f"Voici la liste de toutes les commandes disponibles (le préfixe est `{ctx.clean_prefix}`) :",
         color=discord.Color.blue()
     )
 
-    embed.add_field(name="👮‍♂️ Modération", value="`kick <membre> [raison]`\n`ban <membre> [raison]`\n`unban <nom#tag ou ID>`\n`clear <nombre>`\n`warn <membre> [raison]`\n`unwarn <membre>`\n`mute <membre> [raison]`\n`unmute <membre>`\n`tempmute <membre> <durée> [raison]`\n`lock`\n`unlock`\n`slowmode <secondes>`", inline=False)
+    embed.add_field(name="👮‍♂️ Modération", value="`kick <membre> [raison]`\n`ban <membre> [raison]`\n`unban <nom#tag ou ID>`\n`clear <nombre>`\n`warn <membre> [raison]`\n`unwarn <membre>`\n`mute <membre> [raison]`\n`unmute <membre>`\n`tempmute <membre> <durée> [raison]`\n`lock`\n`unlock`\n`slowmode <secondes>`\n`reloadwords`\n`jobs`\n`modlogs [cible:] [modo:] [action:] [depuis:] [jusqua:]`", inline=False)
     
-    embed.add_field(name="🎫 Système de Tickets", value="`ticketpanel` (pour créer le panel)\n`ticket close` (à utiliser dans un ticket)\n`rename <nouveau_nom>` (dans un ticket)", inline=False)
+    embed.add_field(name="🎫 Système de Tickets", value="`ticketpanel` (pour créer le panel)\n`ticket close` (à utiliser dans un ticket)\n`ticket claim` (staff, dans un ticket)\n`rename <nouveau_nom>` (dans un ticket)", inline=False)
     
-    embed.add_field(name="🛠️ Utilitaires", value="`send <@membre> <message>`\n`sendall <message>`\n`giveaway <durée> <prix>`\n`sondage <question>`\n`userinfo [membre]`\n`banid <ID> [raison]`\n`kickid <ID> [raison]`\n`unbanid <ID>`\n`feedback <message>`\n`ping`\n`serverinfo`\n`8ball <question>`\n`say <message>`", inline=False)
+    embed.add_field(name="🛠️ Utilitaires", value="`send <@membre> <message>`\n`sendall <message>`\n`giveaway <durée> [gagnants] <prix>`\n`reroll <ID message> [nombre]`\n`sondage <question>`\n`userinfo [membre]`\n`banid <ID> [raison]`\n`kickid <ID> [raison]`\n`unbanid <ID>`\n`feedback <message>`\n`prefix [préfixes|reset]`\n`ping`\n`stats`\n`serverinfo`\n`8ball <question>`\n`say <message>`", inline=False)
     
     embed.add_field(name="🛡️ Anti-Raid", value="`raid on`\n`raid off`", inline=False)
 
-    embed.set_footer(text=f"Préfixe actuel : {PREFIX}")
+    prefixes = get_prefixes(ctx.guild)
+    embed.set_footer(text=f"Préfixe{'s' if len(prefixes) > 1 else ''} actuel{'s' if len(prefixes) > 1 else ''} : {' '.join(prefixes)}")
     await ctx.send(embed=embed)
 
 # --- Événements du Bot ---
 @bot.event
 async def on_ready():
+    global startup_seconds
     print(f'Connecté en tant que {bot.user.name} ({bot.user.id})')
     print('------')
-    init_logs()
-    init_warns()
+    # Chargements initiaux dans le travailleur de persistance : la boucle reste libre pendant les lectures
+    for loader in (load_config, init_logs, init_warns, load_giveaways, load_jobs, load_tickets):
+        await persistence.call(loader)
+    if not warns_flush_loop.is_running():
+        warns_flush_loop.start()
+    if not giveaways_flush_loop.is_running():
+        giveaways_flush_loop.start()
+    if LOG_RETENTION_DAYS and not log_compaction_loop.is_running():
+        log_compaction_loop.start()
+    start_job_dispatcher() # Exécute aussi les tâches échues pendant l'arrêt du bot (les tirages attendent resync_giveaways)
     # Ajouter la vue persistante pour le panel de création de tickets
     # Cela permet au bouton du panel de fonctionner même après un redémarrage du bot.
     bot.add_view(TicketCreationView())
+    bot.add_view(MassDMControlView())
+    for guild in bot.guilds:
+        rebuild_ticket_registry(guild)
+    run_in_background(resync_giveaways())
+    await resume_mass_dms()
+    await start_metrics_exporters()
+    if startup_seconds is None: # on_ready est aussi rappelé après une reconnexion
+        startup_seconds = round(time.time() - metrics_started_at, 2)
+        print(f"DEBUG: Prêt en {startup_seconds}s (cache {CACHE_POLICY}) : {metric_gauges['cached_members']()} membres en cache, "
+              f"{process_rss_bytes() // (1024 * 1024)} Mio de mémoire résidente.")
 
 @bot.event
-async def on_message(message):
-    global anti_raid_enabled
-    global user_last_message_times
+async def on_member_join(member):
+    _refresh_staff_member(member)
+    watch_member_join(member)
 
-    if message.author.bot:
-        await bot.process_commands(message)
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        _refresh_staff_member(after)
+
+@bot.event
+async def on_guild_remove(guild):
+    drop_guild_state(guild)
+
+@bot.event
+async def on_shard_ready(shard_id):
+    print(f"DEBUG: Shard {shard_id} prêt ({sum(1 for g in bot.guilds if g.shard_id == shard_id)} serveurs).")
+
+@bot.event
+async def on_member_remove(member):
+    staff_index.get(member.guild.id, {}).pop(member.id, None)
+
+@bot.event
+async def on_member_ban(guild, user):
+    _cache_ban(guild.id, user)
+
+@bot.event
+async def on_member_unban(guild, user):
+    _uncache_ban(guild.id, user)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    # Les permissions d'un rôle ont changé : on reconstruit l'index de ce serveur (événement rare)
+    if before.permissions != after.permissions:
+        staff_index.pop(after.guild.id, None) # Reconstruit au prochain besoin
+
+@bot.event
+async def on_guild_role_delete(role):
+    staff_index.pop(role.guild.id, None)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    # Les nouveaux salons reçoivent directement la surcharge du rôle Muted, s'il est déjà configuré
+    role = channel.guild.get_role(muted_role_ids.get(channel.guild.id, 0))
+    if role is None:
         return
+    try:
+        await channel.set_permissions(role, overwrite=MUTED_OVERWRITE, reason="Configuration du rôle de sourdine")
+    except discord.Forbidden:
+        print(f"DEBUG: Impossible de configurer le rôle {role.name} dans {channel.name} (Forbidden).")
+    except discord.HTTPException as e:
+        print(f"DEBUG: Erreur lors de la configuration du rôle {role.name} dans {channel.name}: {e}")
 
-    lower_content = message.content.lower()
+@bot.event
+async def on_message(message):
+    with timed("on_message", "total"):
+        await _handle_message(message)
 
-    # Modération des mots interdits
-    if any(word in lower_content for word in bad_words):
-        try:
-            await message.delete()
-            await message.channel.send(f"🚫 {message.author.mention}, votre message contient un mot interdit.", delete_after=5)
-            log_action("auto-delete", bot.user, message.author, reason="Mot interdit", details=message.content)
-            print(f"DEBUG: Message de {message.author} supprimé (mot interdit).")
-        except discord.Forbidden:
-            print(f"Avertissement : Le bot n'a pas pu supprimer le message de mot interdit de {message.author} dans {message.channel.name} (permissions manquantes).")
-        except Exception as e:
-            print(f"Erreur lors de la modération des mots interdits : {e}")
+async def _handle_message(message):
+    increment("messages_seen")
 
-    # Anti-Lien d'invitation Discord
-    if "discord.gg/" in lower_content and not message.author.guild_permissions.manage_messages:
-        try:
-            await message.delete()
-            await message.channel.send(f"🚫 {message.author.mention}, les liens d'invitation sont interdits.", delete_after=5)
-            log_action("auto-delete", bot.user, message.author, reason="Lien d'invitation interdit", details=message.content)
-            print(f"DEBUG: Message de {message.author} supprimé (lien d'invitation).")
-        except discord.Forbidden:
-            print(f"Avertissement : Le bot n'a pas pu supprimer le lien d'invitation de {message.author} dans {message.channel.name} (permissions manquantes).")
-        except Exception as e:
-            print(f"Erreur lors de l'anti-lien : {e}")
+    # Les filtres de modération ne concernent que les messages des membres d'un serveur
+    if not message.author.bot and message.guild is not None:
+        with timed("on_message", "filters"):
+            if await run_message_filters(message):
+                return # Message sanctionné (et supprimé) : il n'est pas traité comme une commande
 
-    # Système Anti-Raid
-    if anti_raid_enabled:
-        user_id_str = str(message.author.id)
-        current_time = datetime.now(timezone.utc)
+    # Rejet rapide : la plupart des messages ne sont pas des commandes et n'ont pas à être analysés
+    if not message.content.startswith(get_prefixes(message.guild)):
+        return
+    with timed("on_message", "process_commands"):
+        await bot.process_commands(message)
 
-        # Anti-spam rapide
-        if user_id_str in user_last_message_times:
-            delta = (current_time - user_last_message_times[user_id_str]).total_seconds()
-            if delta < 1: # Si deux messages sont envoyés en moins d'une seconde
-                try:
-                    await message.delete()
-                    await message.channel.send(f"{message.author.mention} : Comportement suspect détecté. Message supprimé.", delete_after=5)
-                    await message.author.ban(reason="Raid détecté : spam rapide")
-                    log_action("antiraid_ban", bot.user, message.author, "Spam rapide")
-                    print(f"DEBUG: {message.author} banni pour spam rapide.")
-                    return # Arrête le traitement du message après le ban
-                except discord.Forbidden:
-                    print(f"Avertissement : Le bot n'a pas pu bannir {message.author} pour spam (permissions manquantes).")
-                except Exception as e:
-                    print(f"Erreur lors du bannissement anti-spam : {e}")
-        user_last_message_times[user_id_str] = current_time
-
-        # Anti-comptes récents
-        account_age = (current_time - message.author.created_at).total_seconds()
-        if account_age < 600: # Si le compte a moins de 10 minutes (600 secondes)
-            try:
-                await message.delete()
-                await message.channel.send(f"{message.author.mention} : Compte trop récent. Banni pour sécurité.", delete_after=5)
-                await message.author.ban(reason="Raid détecté : compte récent")
-                log_action("antiraid_ban", bot.user, message.author, "Compte trop récent")
-                print(f"DEBUG: {message.author} banni pour compte trop récent.")
-                return # Arrête le traitement du message après le ban
-            except discord.Forbidden:
-                print(f"Avertissement : Le bot n'a pas pu bannir {message.author} pour compte récent (permissions manquantes).")
-            except Exception as e:
-                print(f"Erreur lors du bannissement de compte récent : {e}")
+@bot.event
+async def on_command(ctx):
+    ctx.metrics_started_at = time.perf_counter()
+    increment("commands_invoked")
 
-    await bot.process_commands(message)
+@bot.event
+async def on_command_completion(ctx):
+    observe_latency("command", ctx.command.qualified_name, time.perf_counter() - ctx.metrics_started_at)
 
 @bot.event
 async def on_command_error(ctx, error):
+    if ctx.command is not None and hasattr(ctx, "metrics_started_at"):
+        observe_latency("command", ctx.command.qualified_name, time.perf_counter() - ctx.metrics_started_at)
+    increment(f"command_errors_{type(error).__name__}")
     # La permission 'Gérer les messages' est ajoutée ici pour plus de précision sur les erreurs CheckFailure
     if isinstance(error, commands.CommandNotFound):
         pass # Ignore les commandes introuvables (pour ne pas spammer le chat)
     elif isinstance(error, commands.MissingRequiredArgument):
-        await ctx.send(f"❌ Argument(s) manquant(s). Utilisation correcte : `{PREFIX}{ctx.command.name} {ctx.command.signature}`", ephemeral=True)
+        await ctx.send(f"❌ Argument(s) manquant(s). Utilisation correcte : `{ctx.clean_prefix}{ctx.command.name} {ctx.command.signature}`", ephemeral=True)
     elif isinstance(error, commands.BadArgument):
         await ctx.send(f"❌ Argument(s) invalide(s). Veuillez vérifier le type d'argument attendu.", ephemeral=True)
     elif isinstance(error, commands.CheckFailure):
@@ -1171,7 +3911,8 @@ async def on_command_error(ctx, error):
     else:
         print(f"Ignorer l'exception dans la commande {ctx.command} :", error)
         await ctx.send(f"Une erreur inattendue est survenue : {error}", ephemeral=True)
-        log_action("command_error", bot.user, ctx.author, details=str(error))
+        if ctx.guild is not None: # Les erreurs en message privé n'appartiennent à aucun journal de serveur
+            log_action("command_error", bot.user, ctx.author, details=str(error), guild_id=ctx.guild.id)
 
 # --- Exécuter le bot ---
 if TOKEN is None:
@@ -1183,3 +3924,7 @@ else:
         print("Erreur de connexion : Verifier le token present dans le fichier .env !.")
     except Exception as e:
         print(f"Une erreur inattendue est survenue au démarrage du bot : {e}")
+    finally:
+        persistence.stop() # Exécute toutes les écritures encore en file
+        flush_warns() # Ne perdre aucun avertissement encore en mémoire
+        flush_giveaways()